@@ -0,0 +1,311 @@
+# Vectorized Pac-Man: steps many independent games at once with NumPy.
+# Same rules as main.Simulation (movement, dots, power pellets, ghost random walk,
+# ghost collisions, timer), but the ghosts draw from a NumPy generator, so games
+# match the scalar engine statistically rather than tick for tick.
+#
+# Usage: python batch_sim.py --games 2000 --game-times 30 60 90 --ghost-counts 1 3 5 8
+import argparse
+import time
+
+import numpy as np
+
+import main
+from main import TILE_SIZE, FPS, GAME_TIME, POWER_PELLET_DURATION, SCALE_FACTOR
+
+PLAYING, GAME_OVER, WON = 0, 1, 2
+STATE_NAMES = {PLAYING: 'playing', GAME_OVER: 'game_over', WON: 'won'}
+
+# Direction table in the order Ghost.move tries them; index 4 means standing still
+DIRECTIONS = np.array([(1, 0), (-1, 0), (0, 1), (0, -1), (0, 0)], dtype=np.int32)
+STOP = 4
+# main.ACTION_* -> direction index, -1 for ACTION_NONE and CANCEL_TURN for main.ACTION_CANCEL_TURN
+CANCEL_TURN = -2
+ACTION_TO_DIRECTION = np.array([-1, 1, 0, 3, 2, CANCEL_TURN], dtype=np.int8)
+
+# For every 4-bit move mask, how many directions it holds and which, padded with STOP
+MASK_COUNTS = np.array([bin(mask).count('1') for mask in range(16)], dtype=np.intp)
+MASK_DIRECTIONS = np.array([[d for d in range(4) if mask >> d & 1] + [STOP] * (4 - bin(mask).count('1'))
+                            for mask in range(16)], dtype=np.int8)
+
+SPEED = int(2 * SCALE_FACTOR)
+DOT_OFFSET, DOT_SIZE = int(6 * SCALE_FACTOR), int(4 * SCALE_FACTOR)
+PELLET_OFFSET, PELLET_SIZE = int(2 * SCALE_FACTOR), int(12 * SCALE_FACTOR)
+
+
+class BatchSimulation:
+    def __init__(self, games, ghost_count=len(main.GHOST_COLORS), game_time=GAME_TIME, layout=None, seed=None):
+        self.games = games
+        self.ghost_count = ghost_count
+        self.game_time = game_time
+        self.rng = np.random.default_rng(seed)
+
+        # Build one scalar game to read the layout, spawn points and junctions from
+        template = main.Simulation(seed=0, ghost_count=ghost_count, layout=layout)
+        maze = template.maze
+        self.width, self.height = maze.width, maze.height
+        # Walls padded by one open tile so out-of-layout lookups stay open
+        self.walls = np.zeros((self.height + 2, self.width + 2), dtype=bool)
+        self.walls[1:-1, 1:-1] = np.frombuffer(bytes(maze.wall_grid), dtype=np.uint8).reshape(self.height, self.width) == 1
+        self.build_move_masks()
+        self.junctions = np.zeros((self.height, self.width), dtype=bool)
+        for x, y in maze.junctions:
+            self.junctions[y // TILE_SIZE, x // TILE_SIZE] = True
+        self.initial_dots = np.frombuffer(bytes(maze.initial_dot_grid), dtype=np.uint8).reshape(self.height, self.width) != 0
+        self.initial_pellets = np.frombuffer(bytes(maze.pellet_grid), dtype=np.uint8).reshape(self.height, self.width) != 0
+        self.pacman_start = np.array(template.pacman.rect.topleft, dtype=np.int32)
+        self.ghost_start = np.array([ghost.rect.topleft for ghost in template.ghosts], dtype=np.int32).reshape(ghost_count, 2)
+        self.reset()
+
+    def reset(self):
+        n, g = self.games, self.ghost_count
+        self.pac_x = np.full(n, self.pacman_start[0], dtype=np.int32)
+        self.pac_y = np.full(n, self.pacman_start[1], dtype=np.int32)
+        self.pac_dir = np.full(n, STOP, dtype=np.int8)
+        self.next_dir = np.full(n, STOP, dtype=np.int8)
+        self.has_moved = np.zeros(n, dtype=bool)
+        self.ghost_x = np.tile(self.ghost_start[:, 0], (n, 1))
+        self.ghost_y = np.tile(self.ghost_start[:, 1], (n, 1))
+        self.ghost_dir = np.full((n, g), STOP, dtype=np.int8)
+        self.dots = np.repeat(self.initial_dots[None], n, axis=0)
+        self.pellets = np.repeat(self.initial_pellets[None], n, axis=0)
+        self.remaining = np.full(n, self.initial_dots.sum() + self.initial_pellets.sum(), dtype=np.int32)
+        self.score = np.zeros(n, dtype=np.int32)
+        self.lives = np.full(n, 3, dtype=np.int32)
+        self.power_timer = np.zeros(n, dtype=np.int32)
+        self.power_mode = np.zeros(n, dtype=bool)
+        self.state = np.full(n, PLAYING, dtype=np.int8)
+        self.tick = 0
+        self.start_tick = np.full(n, -1, dtype=np.int64)
+        self.end_tick = np.full(n, -1, dtype=np.int64)
+        self.time_left = np.full(n, self.game_time, dtype=np.int32)
+
+    def build_move_masks(self):
+        # Like Maze.move_mask, but for every pixel position up front: bit d is set
+        # where a move in direction d (STOP included) is legal. Two tiles of margin
+        # around the layout hold every off-layout position, so lookups just clamp
+        margin = 2 * TILE_SIZE
+        xs = np.arange(-margin, (self.width + 1) * TILE_SIZE + 1, dtype=np.int32)
+        ys = np.arange(-margin, (self.height + 1) * TILE_SIZE + 1, dtype=np.int32)
+        self.mask_origin = margin
+        self.move_masks = np.zeros((len(ys), len(xs)), dtype=np.uint8)
+        for top in range(0, len(ys), 64):  # Blocks of rows keep the temporaries small on big layouts
+            block = ys[top:top + 64, None]
+            for direction in range(len(DIRECTIONS)):
+                self.move_masks[top:top + 64] |= self.wall_free(xs[None], block, direction).astype(np.uint8) << direction
+
+    def wall_free(self, x, y, direction):
+        # Vectorized Maze.can_move: test the (at most 2x2) tiles the moved rect overlaps
+        dx = DIRECTIONS[direction, 0] * SPEED
+        dy = DIRECTIONS[direction, 1] * SPEED
+        left = x + dx
+        top = y + dy
+        x0 = np.clip(left // TILE_SIZE + 1, 0, self.width + 1)
+        x1 = np.clip((left + TILE_SIZE - 1) // TILE_SIZE + 1, 0, self.width + 1)
+        y0 = np.clip(top // TILE_SIZE + 1, 0, self.height + 1)
+        y1 = np.clip((top + TILE_SIZE - 1) // TILE_SIZE + 1, 0, self.height + 1)
+        blocked = self.walls[y0, x0] | self.walls[y0, x1] | self.walls[y1, x0] | self.walls[y1, x1]
+        return ~blocked
+
+    def masks_at(self, x, y):
+        # move_masks for arrays of pixel positions, one gather
+        rows, columns = self.move_masks.shape
+        return self.move_masks[np.clip(y + self.mask_origin, 0, rows - 1), np.clip(x + self.mask_origin, 0, columns - 1)]
+
+    def can_move(self, x, y, direction):
+        return (self.masks_at(x, y) >> direction & 1).astype(bool)
+
+    def step(self, actions):
+        # actions: one main.ACTION_* code per game
+        active = self.state == PLAYING
+        if not active.any():
+            return
+        self.tick += 1
+
+        # PacMan.handle_input
+        requested = ACTION_TO_DIRECTION[np.asarray(actions)]
+        pressed = active & (requested >= 0)
+        self.next_dir[pressed] = requested[pressed]
+        self.has_moved |= pressed
+        cancelled = active & (requested == CANCEL_TURN)
+        self.next_dir[cancelled] = self.pac_dir[cancelled]
+
+        # PacMan.move: turn if possible, then move if possible
+        turn = active & self.can_move(self.pac_x, self.pac_y, self.next_dir)
+        self.pac_dir[turn] = self.next_dir[turn]
+        go = active & self.can_move(self.pac_x, self.pac_y, self.pac_dir)
+        self.pac_x += np.where(go, DIRECTIONS[self.pac_dir, 0] * SPEED, 0)
+        self.pac_y += np.where(go, DIRECTIONS[self.pac_dir, 1] * SPEED, 0)
+
+        self.collect(active)
+
+        # PacMan.update and Simulation.step both run update_power_mode
+        for _ in range(2):
+            self.power_timer -= self.power_mode & active
+            self.power_mode &= ~(active & (self.power_timer <= 0))
+
+        player_moved = active & self.has_moved
+        self.start_tick[player_moved & (self.start_tick < 0)] = self.tick
+        self.move_ghosts(player_moved)
+        self.check_collisions(active)
+
+        # Timer, counted in ticks like Simulation.step
+        timed = active & (self.start_tick >= 0)
+        elapsed = (self.tick - self.start_tick) // FPS
+        self.time_left = np.where(timed, np.maximum(0, self.game_time - elapsed), self.time_left).astype(np.int32)
+        self.state[timed & (self.time_left <= 0)] = GAME_OVER
+        self.end_tick[active & (self.state != PLAYING)] = self.tick
+
+    def collect(self, active):
+        # PacMan.check_collisions over the tiles Pac-Man overlaps
+        games = np.nonzero(active)[0]
+        x, y = self.pac_x[games], self.pac_y[games]
+        tx0, tx1 = x // TILE_SIZE, (x + TILE_SIZE - 1) // TILE_SIZE
+        ty0, ty1 = y // TILE_SIZE, (y + TILE_SIZE - 1) // TILE_SIZE
+        for tx, ty, distinct in ((tx0, ty0, True), (tx1, ty0, tx1 != tx0), (tx0, ty1, ty1 != ty0),
+                                 (tx1, ty1, (tx1 != tx0) & (ty1 != ty0))):
+            inside = distinct & (tx >= 0) & (tx < self.width) & (ty >= 0) & (ty < self.height)
+            cx = np.clip(tx, 0, self.width - 1)
+            cy = np.clip(ty, 0, self.height - 1)
+            base_x, base_y = tx * TILE_SIZE, ty * TILE_SIZE
+
+            dot = inside & self.dots[games, cy, cx] & self.overlaps(x, y, base_x + DOT_OFFSET, base_y + DOT_OFFSET, DOT_SIZE)
+            self.dots[games[dot], cy[dot], cx[dot]] = False
+            self.score[games[dot]] += 10
+            self.remaining[games[dot]] -= 1
+
+            pellet = inside & self.pellets[games, cy, cx] & self.overlaps(x, y, base_x + PELLET_OFFSET, base_y + PELLET_OFFSET, PELLET_SIZE)
+            self.pellets[games[pellet], cy[pellet], cx[pellet]] = False
+            self.score[games[pellet]] += 50
+            self.remaining[games[pellet]] -= 1
+            self.power_mode[games[pellet]] = True
+            self.power_timer[games[pellet]] = POWER_PELLET_DURATION
+
+    @staticmethod
+    def overlaps(x, y, item_x, item_y, item_size):
+        # Rect.colliderect between a TILE_SIZE square and an item square
+        return (x < item_x + item_size) & (item_x < x + TILE_SIZE) & (y < item_y + item_size) & (item_y < y + TILE_SIZE)
+
+    def move_ghosts(self, player_moved):
+        # Ghost.move random walk for every ghost of every game where the player has moved
+        n, g = self.games, self.ghost_count
+        if g == 0:
+            return
+        # Legal moves as 4-bit masks, bit d for direction d, like Maze.move_mask
+        possible = self.masks_at(self.ghost_x, self.ghost_y) & 15
+        any_possible = possible != 0
+
+        current = self.ghost_dir
+        current_possible = (possible >> current & 1).astype(bool)  # Always false for STOP, bit 4
+        aligned = (self.ghost_x % TILE_SIZE == 0) & (self.ghost_y % TILE_SIZE == 0)
+        tile_x = np.clip(self.ghost_x // TILE_SIZE, 0, self.width - 1)
+        tile_y = np.clip(self.ghost_y // TILE_SIZE, 0, self.height - 1)
+        at_junction = aligned & self.junctions[tile_y, tile_x]
+
+        # 70% keep direction at junctions, 99% elsewhere
+        keep = current_possible & (self.rng.random((n, g)) < np.where(at_junction, 0.7, 0.99))
+        # Junctions pick uniformly among the other legal directions, elsewhere among all of them
+        others = possible & ~(np.uint8(1) << current.astype(np.uint8))
+        candidates = np.where(at_junction & (others != 0), others, possible)
+        pick = (self.rng.random((n, g)) * MASK_COUNTS[candidates]).astype(np.intp)
+        choice = MASK_DIRECTIONS[candidates, pick]
+        new_dir = np.where(keep | (at_junction & (others == 0)), current, choice)
+        new_dir = np.where(any_possible, new_dir, STOP)
+
+        moving = player_moved[:, None]
+        self.ghost_dir = np.where(moving, new_dir, self.ghost_dir).astype(np.int8)
+        step = moving & any_possible
+        self.ghost_x += np.where(step, DIRECTIONS[self.ghost_dir, 0] * SPEED, 0)
+        self.ghost_y += np.where(step, DIRECTIONS[self.ghost_dir, 1] * SPEED, 0)
+
+    def check_collisions(self, active):
+        # Simulation.check_collisions: eat ghosts in power mode, otherwise lose a life
+        hits = active[:, None] & (np.abs(self.ghost_x - self.pac_x[:, None]) < TILE_SIZE) & \
+            (np.abs(self.ghost_y - self.pac_y[:, None]) < TILE_SIZE)
+        eaten = hits & self.power_mode[:, None]
+        self.score += 200 * eaten.sum(axis=1).astype(np.int32)
+        self.ghost_x = np.where(eaten, self.ghost_start[:, 0], self.ghost_x)
+        self.ghost_y = np.where(eaten, self.ghost_start[:, 1], self.ghost_y)
+        self.ghost_dir[eaten] = STOP
+
+        caught = hits.any(axis=1) & ~self.power_mode
+        self.lives[caught] -= 1
+        self.state[caught & (self.lives <= 0)] = GAME_OVER
+        self.reset_positions(caught & (self.lives > 0))
+
+        # Check for win condition
+        self.state[active & (self.remaining == 0)] = WON
+
+    def reset_positions(self, games):
+        self.pac_x[games], self.pac_y[games] = self.pacman_start
+        self.pac_dir[games] = STOP
+        self.next_dir[games] = STOP
+        self.has_moved[games] = False
+        self.ghost_x[games] = self.ghost_start[:, 0]
+        self.ghost_y[games] = self.ghost_start[:, 1]
+        self.ghost_dir[games] = STOP
+
+    def run(self, agent, max_ticks=None):
+        # Step until every game has ended; agent(batch) returns one action per game
+        if max_ticks is None:
+            max_ticks = (self.game_time + 1) * FPS * 4
+        while self.tick < max_ticks and (self.state == PLAYING).any():
+            self.step(agent(self))
+        return self.results()
+
+    def results(self):
+        return {
+            'score': self.score.copy(),
+            'lives_lost': 3 - np.maximum(self.lives, 0),
+            'ticks': np.where(self.end_tick >= 0, self.end_tick, self.tick),
+            'won': self.state == WON,
+            'state': self.state.copy(),
+        }
+
+
+class RandomAgent:
+    # Holds a random arrow key and switches to another one with a small chance per tick,
+    # like a player wandering the maze
+    def __init__(self, games, switch_chance=0.05, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.switch_chance = switch_chance
+        self.actions = self.rng.integers(main.ACTION_LEFT, main.ACTION_DOWN + 1, games)
+
+    def __call__(self, batch):
+        switch = self.rng.random(batch.games) < self.switch_chance
+        self.actions = np.where(switch, self.rng.integers(main.ACTION_LEFT, main.ACTION_DOWN + 1, batch.games), self.actions)
+        return self.actions
+
+
+def difficulty_study(game_times, ghost_counts, games=1000, seed=0, layout=None):
+    # Monte-Carlo win rate for each (GAME_TIME, ghost count) pair
+    rows = []
+    for ghost_count in ghost_counts:
+        for game_time in game_times:
+            batch = BatchSimulation(games, ghost_count, game_time, layout, seed)
+            started = time.perf_counter()
+            results = batch.run(RandomAgent(games, seed=seed))
+            elapsed = time.perf_counter() - started
+            rows.append({
+                'ghost_count': ghost_count,
+                'game_time': game_time,
+                'games': games,
+                'win_rate': float(results['won'].mean()),
+                'mean_score': float(results['score'].mean()),
+                'mean_lives_lost': float(results['lives_lost'].mean()),
+                'games_per_second': games / elapsed,
+            })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte-Carlo difficulty study on the batched simulator")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--game-times", type=int, nargs="+", default=[GAME_TIME])
+    parser.add_argument("--ghost-counts", type=int, nargs="+", default=[len(main.GHOST_COLORS)])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'ghosts':>6} {'time':>5} {'win rate':>9} {'score':>8} {'lives lost':>11} {'games/s':>9}")
+    for row in difficulty_study(args.game_times, args.ghost_counts, args.games, args.seed):
+        print(f"{row['ghost_count']:>6} {row['game_time']:>5} {row['win_rate']:>9.3f} {row['mean_score']:>8.1f} "
+              f"{row['mean_lives_lost']:>11.2f} {row['games_per_second']:>9.1f}")
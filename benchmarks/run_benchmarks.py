@@ -0,0 +1,221 @@
+# Deterministic benchmarks for the game loop and its subsystems. Runs headless
+# (SDL dummy video driver), seeds every random source, and writes the timings to
+# a JSON file that later runs can be compared against.
+#
+# Usage: python benchmarks/run_benchmarks.py --out bench.json
+#        python benchmarks/run_benchmarks.py --out new.json --compare bench.json --threshold 0.15
+#        python benchmarks/run_benchmarks.py --only maze ghost --quick
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # Assets are loaded relative to the game directory
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import platform  # noqa: E402
+import random  # noqa: E402
+import statistics  # noqa: E402
+import time  # noqa: E402
+
+import pygame  # noqa: E402
+
+import main  # noqa: E402
+from levels import DEFAULT_LEVEL, as_level, compile_layout  # noqa: E402
+from tournament import RandomAgent  # noqa: E402
+
+BENCHMARKS = []
+
+
+def benchmark(name, ops, setup=None):
+    # Registers fn(repeat_index) -> None; ops is how many operations one call performs.
+    # With setup, fn gets setup(repeat_index) instead, built outside the timing
+    def register(fn):
+        BENCHMARKS.append((name, ops, fn, setup))
+        return fn
+    return register
+
+
+def scaled_layout(factor):
+    # The built-in maze tiled factor x factor times, as (metadata, rows); the
+    # classic spawns land in the top-left copy
+    with open(DEFAULT_LEVEL) as f:
+        metadata = [line.rstrip('\n') for line in f if line.startswith(';')]
+    layout = main.load_maze()
+    return metadata, [row * factor for row in layout] * factor
+
+
+def open_positions(maze):
+    if maze.node_index is None:
+        maze.build_navigation()
+    return [(x * main.TILE_SIZE, y * main.TILE_SIZE) for x, y in maze.node_tiles]
+
+
+# Micro-benchmarks
+
+LEVEL = as_level()
+MAZE = main.Maze(LEVEL, random.Random(0))
+POSITIONS = open_positions(MAZE)
+DIRECTIONS = main.GHOST_DIRECTIONS
+
+
+@benchmark("maze.create_maze", 20)
+def bench_create_maze(_):
+    for _ in range(20):
+        main.Maze(LEVEL, random.Random(0))
+
+
+@benchmark("maze.identify_junctions", 200)
+def bench_identify_junctions(_):
+    for _ in range(200):
+        MAZE.junctions = set()
+        MAZE.identify_junctions()
+
+
+@benchmark("pacman.can_move", len(POSITIONS) * 4)
+def bench_can_move(_):
+    pacman = main.PacMan(MAZE.pacman_start)
+    for position in POSITIONS:
+        pacman.rect.topleft = position
+        for direction in DIRECTIONS:
+            pacman.can_move(direction, MAZE)
+
+
+@benchmark("pacman.check_collisions", len(POSITIONS))
+def bench_check_collisions(_):
+    MAZE.reset()
+    pacman = main.PacMan(MAZE.pacman_start)
+    for position in POSITIONS:
+        pacman.rect.topleft = position
+        pacman.check_collisions(MAZE)
+
+
+@benchmark("ghost.move", 5000)
+def bench_ghost_move(repeat):
+    rng = random.Random(repeat)
+    ghost = main.Ghost(MAZE.pacman_start, main.BLUE)
+    for _ in range(5000):
+        ghost.move(MAZE, rng)
+
+
+@benchmark("ghost.handle_blinking", 5000)
+def bench_handle_blinking(_):
+    ghost = main.Ghost(MAZE.pacman_start, main.BLUE)
+    for i in range(5000):
+        ghost.power_mode = i % 600 < 300
+        ghost.handle_blinking()
+
+
+# Macro-benchmarks: seeded frames of the full loop
+
+def frame_setup(ghost_count, factor):
+    # A seeded Game driven by a RandomAgent through its playback hook; the layout
+    # is compiled once per factor and the game built per repeat, both untimed
+    if factor > 1:
+        metadata, rows = scaled_layout(factor)
+        level = compile_layout(rows, metadata)
+    else:
+        level = LEVEL
+
+    def setup(repeat):
+        game = main.Game(seed=repeat, ghost_count=ghost_count, layout=level)
+        agent = RandomAgent(repeat)
+        game.playback = iter(lambda: agent(game), None)
+        return game
+    return setup
+
+
+def frames(frame_count, draw):
+    # frame_count frames of Game.update, one fixed step each, and Game.draw if draw
+    def run(game):
+        for _ in range(frame_count):
+            if game.state != 'playing':
+                game.reset()
+                if draw:
+                    game.build_background()
+            game.update(main.STEP_TIME)
+            if draw:
+                pygame.display.update(game.draw())
+    return run
+
+
+for ghost_count, factor in ((5, 1), (50, 1), (200, 1), (5, 2), (50, 4)):
+    suffix = f"{ghost_count}_ghosts" + (f"_maze_x{factor}" if factor > 1 else "")
+    setup = frame_setup(ghost_count, factor)
+    benchmark(f"frame.update_draw.{suffix}", 600, setup)(frames(600, draw=True))
+    benchmark(f"frame.update.{suffix}", 600, setup)(frames(600, draw=False))
+
+
+def run_benchmarks(repeats, only=None):
+    results = {}
+    for name, ops, fn, setup in BENCHMARKS:
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        fn(setup(0) if setup else 0)  # Warm caches (sprites, distance rows) outside the timings
+        timings = []
+        for repeat in range(repeats):
+            argument = setup(repeat) if setup else repeat
+            started = time.perf_counter()
+            fn(argument)
+            timings.append(time.perf_counter() - started)
+        median = statistics.median(timings)
+        results[name] = {
+            'ops': ops,
+            'repeats': repeats,
+            'median_s': median,
+            'min_s': min(timings),
+            'per_op_us': median / ops * 1e6,
+        }
+        print(f"{name:<45} {results[name]['per_op_us']:>12.2f} us/op  ({median * 1000:.1f} ms per run)")
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Benchmarks slower than baseline by more than threshold (a fraction) are regressions
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        change = result['per_op_us'] / before['per_op_us'] - 1
+        flag = "REGRESSION" if change > threshold else ("faster" if change < -threshold else "")
+        print(f"{name:<45} {before['per_op_us']:>10.2f} -> {result['per_op_us']:>10.2f} us/op  {change:+7.1%}  {flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Pac-Man game loop headless")
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="one timed run per benchmark")
+    parser.add_argument("--only", nargs="+", help="name prefixes to run, e.g. maze ghost frame.update.")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown before flagging, e.g. 0.10")
+    args = parser.parse_args()
+
+    results = run_benchmarks(1 if args.quick else args.repeats, args.only)
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'platform': platform.platform(),
+            'scale_factor': main.SCALE_FACTOR,
+        },
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
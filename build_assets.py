@@ -0,0 +1,74 @@
+# Build step for the game's images: scales every sprite to its in-game size for
+# the current SCALE_FACTOR and packs them into one atlas with a JSON index, so
+# the game decodes a single small PNG instead of the full-size sources.
+#
+# Usage: python build_assets.py   (re-run whenever SCALE_FACTOR or an image changes)
+import json
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame  # noqa: E402
+
+import main  # noqa: E402
+
+ATLAS_PADDING = 1  # Transparent pixels between sprites
+
+
+def asset_manifest():
+    # (source path, size in game) for every image the game loads
+    pellets = [f"{main.SPORTS_BALLS_DIR}/{filename}" for filename in sorted(os.listdir(main.SPORTS_BALLS_DIR))
+               if filename.endswith('.png')]
+    manifest = [
+        (main.BUTTOM_IMAGE, main.BUTTOM_SIZE),
+        (main.PACMAN_IMAGE, (main.TILE_SIZE, main.TILE_SIZE)),
+    ]
+    manifest.extend((path, main.PELLET_IMAGE_SIZE) for path in pellets)
+    return manifest, pellets
+
+
+def pack(sizes, width):
+    # Shelf packing: tallest first, left to right, a new row when one is full
+    positions = {}
+    x = y = row_height = 0
+    for path, (w, h) in sorted(sizes.items(), key=lambda item: -item[1][1]):
+        if x + w > width:
+            x, y = 0, y + row_height + ATLAS_PADDING
+            row_height = 0
+        positions[path] = (x, y)
+        x += w + ATLAS_PADDING
+        row_height = max(row_height, h)
+    return positions, y + row_height
+
+
+def build_atlas():
+    pygame.display.set_mode((1, 1))  # convert_alpha needs a display, even a dummy one
+    manifest, pellets = asset_manifest()
+    images = {}
+    for path, size in manifest:
+        # Same conversion and scaling as main.load_image uses on the source files
+        images[path] = pygame.transform.scale(pygame.image.load(path).convert_alpha(), size)
+    width = max(image.get_width() for image in images.values())
+    positions, height = pack({path: image.get_size() for path, image in images.items()}, width)
+
+    atlas = pygame.Surface((width, height), pygame.SRCALPHA)
+    index = {'scale_factor': main.SCALE_FACTOR, 'images': {}, 'pellets': pellets}
+    for path, image in images.items():
+        x, y = positions[path]
+        # RGBA_MAX onto the cleared atlas copies pixels exactly instead of alpha blending them
+        atlas.blit(image, (x, y), special_flags=pygame.BLEND_RGBA_MAX)
+        index['images'][path] = [x, y, image.get_width(), image.get_height()]
+
+    os.makedirs(os.path.dirname(main.ATLAS_IMAGE), exist_ok=True)
+    pygame.image.save(atlas, main.ATLAS_IMAGE)
+    with open(main.ATLAS_INDEX, 'w') as f:
+        json.dump(index, f, indent=2)
+
+    source_bytes = sum(os.path.getsize(path) for path, _ in manifest)
+    atlas_bytes = os.path.getsize(main.ATLAS_IMAGE) + os.path.getsize(main.ATLAS_INDEX)
+    print(f"Packed {len(manifest)} images into {width}x{height} {main.ATLAS_IMAGE}: "
+          f"{source_bytes // 1024} KB of sources -> {atlas_bytes // 1024} KB")
+
+
+if __name__ == "__main__":
+    build_atlas()
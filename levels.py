@@ -0,0 +1,317 @@
+# Level files and their compiled cache.
+#
+# A level is a text file of maze rows ('#' wall, '.' dot, 'o' power pellet,
+# anything else open) preceded by optional '; key: value' lines:
+#
+#   ; pacman: 13 23                       Pac-Man's spawn tile
+#   ; ghosts: 12 11, 13 11, 12.5 12       Ghost spawn tiles, halves allowed
+#   ; ghost_box: 12 11 15 12              Tiles searched when a spawn is blocked
+#
+# Compiling turns it into flat byte grids and tile index arrays. The result is
+# cached next to the source as <name>.pmlv, so loading a level again is one read
+# with no per-tile work, however big the maze is.
+#
+# Usage: python levels.py compile levels/*.txt
+#        python levels.py generate 500 500 --seed 1 --out levels/stress-500.txt
+import argparse
+import os
+import random
+import struct
+import sys
+import zlib
+from array import array
+
+LEVELS_DIR = "levels"
+DEFAULT_LEVEL = os.path.join(LEVELS_DIR, "classic.txt")
+CACHE_EXTENSION = ".pmlv"
+LEVEL_MAGIC = b'PMLV'
+LEVEL_VERSION = 2  # Bumped when compiling starts rejecting levels an older version accepted
+# magic, version, width, height, source mtime_ns, source size, CRC32, Pac-Man spawn, ghost box, counts of
+# ghost spawns, dots, pellets and junctions
+HEADER = struct.Struct('<4sHIIqqIii4iIIII')
+# Spawns are stored in half tiles so ghosts can start between two tiles. These are
+# the classic maze's, used only when its rows come without their metadata lines
+PACMAN_SPAWN = (26, 46)
+GHOST_SPAWNS = ((24, 22), (26, 22), (28, 22), (25, 24), (27, 24))
+GHOST_BOX = (12, 11, 15, 12)
+WALL = ord('#')
+DOT = ord('.')
+PELLET = ord('o')
+
+
+class LevelError(ValueError):
+    pass
+
+
+class Level:
+    # A compiled maze: everything Maze needs, with nothing left to parse
+    def __init__(self, width, height, wall_grid, dot_grid, dot_tiles, pellet_tiles, junctions,
+                 pacman_spawn=PACMAN_SPAWN, ghost_spawns=GHOST_SPAWNS, ghost_box=GHOST_BOX, crc=0):
+        self.width = width
+        self.height = height
+        self.wall_grid = wall_grid  # width * height bytes, 1 for walls, indexed y * width + x
+        self.dot_grid = dot_grid  # Same layout, 1 for dots
+        self.dot_tiles = dot_tiles  # array('i') of dot tile indices in scan order
+        self.pellet_tiles = pellet_tiles  # array('i') of pellet tile indices in scan order
+        self.junctions = junctions  # array('i') of tile indices with 3+ open neighbours
+        self.pacman_spawn = pacman_spawn  # (x, y) in half tiles
+        self.ghost_spawns = ghost_spawns  # ((x, y), ...) in half tiles
+        self.ghost_box = ghost_box  # (x0, y0, x1, y1) tiles, inclusive
+        self.crc = crc  # Of the source text, to tell levels apart in replays
+
+    def to_bytes(self, mtime_ns=0, size=0):
+        header = HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, self.width, self.height, mtime_ns, size, self.crc,
+                             *self.pacman_spawn, *self.ghost_box, len(self.ghost_spawns), len(self.dot_tiles),
+                             len(self.pellet_tiles), len(self.junctions))
+        spawns = array('i', [coordinate for spawn in self.ghost_spawns for coordinate in spawn])
+        return b''.join((header, spawns.tobytes(), bytes(self.wall_grid), bytes(self.dot_grid),
+                         self.dot_tiles.tobytes(), self.pellet_tiles.tobytes(), self.junctions.tobytes()))
+
+    @classmethod
+    def from_bytes(cls, data):
+        # Returns the level and the source (mtime_ns, size) it was compiled from
+        if len(data) < HEADER.size:
+            raise LevelError("Compiled level is truncated")
+        (magic, version, width, height, mtime_ns, size, crc, pacman_x, pacman_y, box_x0, box_y0, box_x1, box_y1,
+         ghost_count, dot_count, pellet_count, junction_count) = HEADER.unpack_from(data)
+        if magic != LEVEL_MAGIC or version != LEVEL_VERSION:
+            raise LevelError("Not a compiled level of this version")
+        offset = HEADER.size
+
+        def take(length):
+            nonlocal offset
+            chunk = data[offset:offset + length]
+            if len(chunk) != length:
+                raise LevelError("Compiled level is truncated")
+            offset += length
+            return chunk
+
+        def take_indices(count):
+            indices = array('i')
+            indices.frombytes(take(count * indices.itemsize))
+            return indices
+
+        spawns = take_indices(ghost_count * 2)
+        level = cls(width, height, take(width * height), take(width * height), take_indices(dot_count),
+                    take_indices(pellet_count), take_indices(junction_count), (pacman_x, pacman_y),
+                    tuple(zip(spawns[::2], spawns[1::2])), (box_x0, box_y0, box_x1, box_y1), crc)
+        return level, (mtime_ns, size)
+
+
+def parse_spawns(value):
+    spawns = []
+    for pair in value.split(','):
+        x, y = pair.split()
+        spawns.append((round(float(x) * 2), round(float(y) * 2)))
+    return spawns
+
+
+def compile_layout(rows, metadata=()):
+    # Layout rows (and '; key: value' lines) -> Level; the only per-tile pass
+    if not rows:
+        raise LevelError("Level has no rows")
+    width, height = len(rows[0]), len(rows)
+    if any(len(row) != width for row in rows):
+        raise LevelError("Level rows must all be the same length")
+    pacman_spawn = ghost_spawns = ghost_box = None
+    for line in metadata:
+        key, _, value = line.lstrip(';').partition(':')
+        key = key.strip()
+        try:
+            if key == 'pacman':
+                pacman_spawn = parse_spawns(value)[0]
+            elif key == 'ghosts':
+                ghost_spawns = tuple(parse_spawns(value))
+            elif key == 'ghost_box':
+                ghost_box = tuple(int(v) for v in value.split())
+                if len(ghost_box) != 4:
+                    raise ValueError
+        except ValueError:
+            raise LevelError(f"Bad level metadata line: {line!r}") from None
+    if None in (pacman_spawn, ghost_spawns, ghost_box):
+        if rows != read_layout(DEFAULT_LEVEL):
+            missing = [key for key, value in (('pacman', pacman_spawn), ('ghosts', ghost_spawns), ('ghost_box', ghost_box))
+                       if value is None]
+            raise LevelError(f"Level needs '; {missing[0]}:' metadata; only the classic maze has defaults")
+        pacman_spawn = pacman_spawn or PACMAN_SPAWN
+        ghost_spawns = ghost_spawns or GHOST_SPAWNS
+        ghost_box = ghost_box or GHOST_BOX
+
+    text = ''.join(rows).encode('latin-1', 'replace')
+    # One byte per tile by translation, without a Python loop over the tiles
+    wall_grid = text.translate(bytes(1 if c == WALL else 0 for c in range(256)))
+    dot_grid = text.translate(bytes(1 if c == DOT else 0 for c in range(256)))
+    dot_tiles = array('i', find_all(text, DOT))
+    pellet_tiles = array('i', find_all(text, PELLET))
+    junctions = array('i')
+    for index in find_all(wall_grid, 0):
+        x, y = index % width, index // width
+        open_neighbours = ((x > 0 and not wall_grid[index - 1]) + (x < width - 1 and not wall_grid[index + 1]) +
+                           (y > 0 and not wall_grid[index - width]) + (y < height - 1 and not wall_grid[index + width]))
+        if open_neighbours >= 3:
+            junctions.append(index)
+    check_spawn('Pac-Man', pacman_spawn, wall_grid, width, height)
+    for spawn in ghost_spawns:
+        check_spawn('Ghost', spawn, wall_grid, width, height)
+    x0, y0, x1, y1 = ghost_box
+    if not (0 <= x0 <= x1 < width and 0 <= y0 <= y1 < height):
+        raise LevelError(f"Ghost box {ghost_box} is not inside the {width}x{height} level")
+    if all(wall_grid[y * width + x] for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)):
+        raise LevelError(f"Ghost box {ghost_box} has no open tile")
+    crc = zlib.crc32('\n'.join(list(metadata) + list(rows)).encode())
+    return Level(width, height, wall_grid, dot_grid, dot_tiles, pellet_tiles, junctions,
+                 pacman_spawn, ghost_spawns, ghost_box, crc)
+
+
+def check_spawn(name, spawn, wall_grid, width, height):
+    # An actor at spawn (half tiles) covers one to four tiles, all of which must be open
+    x, y = spawn
+    for tile_y in range(y // 2, (y + 1) // 2 + 1):
+        for tile_x in range(x // 2, (x + 1) // 2 + 1):
+            if not (0 <= tile_x < width and 0 <= tile_y < height):
+                raise LevelError(f"{name} spawn {x / 2:g} {y / 2:g} is outside the {width}x{height} level")
+            if wall_grid[tile_y * width + tile_x]:
+                raise LevelError(f"{name} spawn {x / 2:g} {y / 2:g} is on a wall")
+
+
+def find_all(data, value):
+    # Indices of every byte equal to value, found at C speed
+    needle = bytes((value,))
+    index = data.find(needle)
+    while index >= 0:
+        yield index
+        index = data.find(needle, index + 1)
+
+
+def parse_text_level(path):
+    with open(path) as f:
+        lines = [line.rstrip('\n') for line in f if line.strip('\n')]
+    metadata = [line for line in lines if line.startswith(';')]
+    rows = [line for line in lines if not line.startswith(';')]
+    # Editors strip trailing spaces, which are open tiles anyway
+    width = max((len(row) for row in rows), default=0)
+    return compile_layout([row.ljust(width) for row in rows], metadata)
+
+
+# Source extension -> function(path) returning a Level; add entries for other formats
+LEVEL_LOADERS = {
+    '.txt': parse_text_level,
+}
+
+
+def cache_path(path):
+    return os.path.splitext(path)[0] + CACHE_EXTENSION
+
+
+def load_level(path):
+    # Compiled cache when it matches the source, otherwise compile and refresh it
+    if path.endswith(CACHE_EXTENSION):
+        with open(path, 'rb') as f:
+            return Level.from_bytes(f.read())[0]
+    stat = os.stat(path)
+    cached = cache_path(path)
+    try:
+        with open(cached, 'rb') as f:
+            level, source = Level.from_bytes(f.read())
+        if source == (stat.st_mtime_ns, stat.st_size):
+            return level
+    except (OSError, LevelError):
+        pass
+    loader = LEVEL_LOADERS.get(os.path.splitext(path)[1])
+    if loader is None:
+        raise LevelError(f"No level loader for {path!r}; known extensions: {sorted(LEVEL_LOADERS)}")
+    level = loader(path)
+    try:
+        with open(cached, 'wb') as f:
+            f.write(level.to_bytes(stat.st_mtime_ns, stat.st_size))
+    except OSError:
+        pass  # Read-only installs just compile every time
+    return level
+
+
+def read_layout(path):
+    # The raw maze rows of a text level, without its metadata
+    with open(path) as f:
+        return [line.rstrip('\n') for line in f if line.strip('\n') and not line.startswith(';')]
+
+
+def as_level(layout=None):
+    # A Level from a Level, a list of layout rows, or None for the default level
+    if layout is None:
+        return load_level(DEFAULT_LEVEL)
+    if isinstance(layout, Level):
+        return layout
+    return compile_layout(layout)
+
+
+def generate_layout(width, height, seed=None, loops=0.1):
+    # Random maze of corridors one tile wide: a depth-first spanning tree over the
+    # odd tiles, with a share of the remaining walls knocked through to make loops
+    rng = random.Random(seed)
+    width -= 1 - width % 2  # Odd sizes keep a wall border around the odd-tile grid
+    height -= 1 - height % 2
+    if width < 9 or height < 9:
+        raise LevelError("Generated levels need at least 9x9 tiles")
+    grid = [bytearray(b'#' * width) for _ in range(height)]
+    grid[1][1] = DOT
+    stack = [(1, 1)]
+    while stack:
+        x, y = stack[-1]
+        options = [(dx, dy) for dx, dy in ((2, 0), (-2, 0), (0, 2), (0, -2))
+                   if 0 < x + dx < width - 1 and 0 < y + dy < height - 1 and grid[y + dy][x + dx] == WALL]
+        if not options:
+            stack.pop()
+            continue
+        dx, dy = rng.choice(options)
+        grid[y + dy // 2][x + dx // 2] = grid[y + dy][x + dx] = DOT
+        stack.append((x + dx, y + dy))
+    for y in range(1, height - 1):
+        for x in range(1, width - 1):
+            # Walls between two corridors, horizontally or vertically
+            if grid[y][x] == WALL and (x % 2) != (y % 2) and rng.random() < loops:
+                grid[y][x] = DOT
+
+    # Ghost box in the middle, spawn below it, a pellet near each corner
+    box_x0, box_y0 = width // 2 - 2, height // 2 - 1
+    for y in range(box_y0, box_y0 + 2):
+        for x in range(box_x0, box_x0 + 4):
+            grid[y][x] = ord(' ')
+    spawn_x, spawn_y = width // 2 | 1, min(height - 2, box_y0 + 3) | 1
+    grid[spawn_y][spawn_x] = ord(' ')
+    for x, y in ((1, 1), (width - 2, 1), (1, height - 2), (width - 2, height - 2)):
+        grid[y][x] = PELLET
+    metadata = [
+        f"; pacman: {spawn_x} {spawn_y}",
+        f"; ghosts: {box_x0} {box_y0}, {box_x0 + 1} {box_y0}, {box_x0 + 2} {box_y0}, "
+        f"{box_x0 + 0.5} {box_y0 + 1}, {box_x0 + 1.5} {box_y0 + 1}",
+        f"; ghost_box: {box_x0} {box_y0} {box_x0 + 3} {box_y0 + 1}",
+    ]
+    return metadata, [row.decode() for row in grid]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile or generate Pac-Man levels")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_command = commands.add_parser("compile", help="refresh the compiled cache of level files")
+    compile_command.add_argument("paths", nargs="+")
+    generate_command = commands.add_parser("generate", help="write a random maze as a level file")
+    generate_command.add_argument("width", type=int)
+    generate_command.add_argument("height", type=int)
+    generate_command.add_argument("--seed", type=int, default=None)
+    generate_command.add_argument("--loops", type=float, default=0.1, help="share of inner walls removed")
+    generate_command.add_argument("--out", default="-")
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        for path in args.paths:
+            level = load_level(path)
+            print(f"{path}: {level.width}x{level.height}, {len(level.dot_tiles)} dots, "
+                  f"{len(level.junctions)} junctions -> {cache_path(path)}")
+    else:
+        metadata, rows = generate_layout(args.width, args.height, args.seed, args.loops)
+        text = '\n'.join(metadata + rows) + '\n'
+        if args.out == '-':
+            sys.stdout.write(text)
+        else:
+            with open(args.out, 'w') as f:
+                f.write(text)
@@ -3,12 +3,23 @@ import sys
 import random
 import os
 import asyncio  # Import asyncio
+import json
+import time
+from array import array
+from collections import OrderedDict, deque
+
+from levels import DEFAULT_LEVEL, as_level, read_layout
+from profiler import OVERLAY_REFRESH, profiling_requested, start_profiler
+from telemetry import start_telemetry, telemetry_sink_spec
 
 # Constants
 SCALE_FACTOR = 1.5  # Increase the game size by this factor
 TILE_SIZE = int(16 * SCALE_FACTOR)
 WIDTH, HEIGHT = int(448 * SCALE_FACTOR), int(496 * SCALE_FACTOR)
-FPS = 60
+FPS = 60  # Logic steps per second; speeds and durations below are per step
+STEP_TIME = 1 / FPS
+RENDER_FPS = int(os.environ.get("PACMAN_RENDER_FPS", "144"))  # Cap on drawn frames per second, 0 for none
+MAX_FRAME_TIME = 0.25  # Longer stalls are dropped instead of replayed as a burst of steps
 BLACK = (0, 0, 0)
 GLOWING_YELLOW = (229, 255, 0)
 WHITE = (255, 255, 255)
@@ -19,121 +30,541 @@ RED = (255, 0, 0)
 FONT_SIZE = int(24 * SCALE_FACTOR)
 POWER_PELLET_DURATION = FPS * 10  # Power mode lasts for 10 seconds
 GAME_TIME = 90  # 90 seconds
+GHOST_MODE = os.environ.get("PACMAN_GHOST_MODE", "random")  # 'random' walk or 'chase' along maze distances
+GHOST_SCATTER_TICKS = FPS * 7  # Chase mode: ghosts head for their corners this long...
+GHOST_CHASE_TICKS = FPS * 20  # ...then chase Pac-Man this long, and repeat
+COUNT_SURFACES = os.environ.get("PACMAN_COUNT_SURFACES") == "1"  # Report Surfaces allocated per frame
+
+PACMAN_IMAGE = "WSC SPORTS_Logo_03_White.png"
+BUTTOM_IMAGE = "buttom.png"
+BUTTOM_SIZE = (WIDTH, int(50 * SCALE_FACTOR))
+SPORTS_BALLS_DIR = "sports_balls"
+PELLET_IMAGE_SIZE = (int(12 * SCALE_FACTOR), int(12 * SCALE_FACTOR))
+# Images pre-scaled for SCALE_FACTOR by build_assets.py; the source files are the fallback
+ATLAS_IMAGE = os.path.join("assets", "atlas.png")
+ATLAS_INDEX = os.path.join("assets", "atlas.json")
+GHOST_COLORS = [BLUE, BLACK, RED, YELLOW, GREEN]
+
+# Direction codes index the preallocated tables below; ghosts try them in code order
+STOP, RIGHT, LEFT, DOWN, UP = range(5)
+DIRECTION_VECTORS = ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1))
+REVERSE = (STOP, LEFT, RIGHT, UP, DOWN)
+GHOST_DIRECTIONS = (RIGHT, LEFT, DOWN, UP)
+ACTOR_SPEED = 2 * SCALE_FACTOR
+# Pixel offset of one move in each direction; every actor moves at ACTOR_SPEED
+DIRECTION_STEPS = tuple((int(dx * ACTOR_SPEED), int(dy * ACTOR_SPEED)) for dx, dy in DIRECTION_VECTORS)
+# One bit per direction, and for every set of bits the directions it holds, in code order
+DIRECTION_BITS = (0, 1, 2, 4, 8)
+DIRECTIONS_IN_MASK = tuple(tuple(d for d in GHOST_DIRECTIONS if mask & DIRECTION_BITS[d]) for mask in range(16))
+
+# Keys of per-position tables: y * POSITION_STRIDE + x, unique for any maze that fits in memory
+POSITION_STRIDE = 1 << 24
+MAX_MOVE_MASKS = 1 << 18  # Memoised move masks kept per maze before the table starts over
+# Ghost count from which the GhostGrid broad phase replaces the ordered linear scan.
+# The scan is one C collidelist call, while the grid costs dict work per ghost per
+# step; stress.py --compare found the grid about 1.3x slower all the way from 50 to
+# 5000 ghosts, so it stays off unless a crowd is far bigger than that
+GHOST_GRID_MIN_GHOSTS = 100000
+
+# Dots and pellets sit inside their tile at these offsets
+DOT_OFFSET, DOT_SIZE = int(6 * SCALE_FACTOR), int(4 * SCALE_FACTOR)
+PELLET_OFFSET = int(2 * SCALE_FACTOR)
+
+# Input actions for Simulation.step; ACTION_NONE keeps the last requested turn
+ACTION_NONE = 0
+ACTION_LEFT = 1
+ACTION_RIGHT = 2
+ACTION_UP = 3
+ACTION_DOWN = 4
+ACTION_CANCEL_TURN = 5  # Drop a requested turn that has not happened yet
+ACTION_DIRECTIONS = {
+    ACTION_LEFT: LEFT,
+    ACTION_RIGHT: RIGHT,
+    ACTION_UP: UP,
+    ACTION_DOWN: DOWN,
+}
+
+# Keyboard and touch input
+KEY_ACTIONS = {
+    pygame.K_LEFT: ACTION_LEFT,
+    pygame.K_RIGHT: ACTION_RIGHT,
+    pygame.K_UP: ACTION_UP,
+    pygame.K_DOWN: ACTION_DOWN,
+}
+CHEAT_KEYS = (pygame.K_w, pygame.K_s, pygame.K_c)
+TURN_BUFFER_TIME = 0.25  # Seconds a released or swiped turn waits for an opening
+SWIPE_DISTANCE = 0.05  # Share of the screen a finger travels before it counts as a swipe
+
+# Display objects are created by init_display(), so the game rules can be
+# imported and stepped without a window
+screen = None
+clock = None
+font = None
+text_cache = None
+
+
+def init_display():
+    global screen, clock, font, text_cache
+    if screen is not None:
+        return
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Pac-Man")
+    clock = pygame.time.Clock()
+    font = pygame.font.Font(None, FONT_SIZE)
+    text_cache = TextCache(font)
+
+
+
+class SurfaceCounter:
+    # Counts Surfaces the game creates, to check the render loop does not allocate
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.total = 0
+        self.frame_start = 0
+        self.frame = 0
+
+    def add(self, surface):
+        self.total += 1
+        return surface
+
+    def end_frame(self):
+        allocated = self.total - self.frame_start
+        self.frame_start = self.total
+        self.frame += 1
+        if self.enabled and allocated:
+            print(f"Frame {self.frame}: {allocated} new Surface(s), {self.total} total")
+        return allocated
+
+
+surface_counter = SurfaceCounter(COUNT_SURFACES)
+
+
+class TextCache:
+    # Rendered text keyed by (text, color); the least recently used entry is dropped first
+    def __init__(self, font, max_size=64):
+        self.font = font
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+
+    def render(self, text, color):
+        key = (text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = surface_counter.add(self.font.render(text, True, color))
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.max_size:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+# Ghost sprites shared by every Ghost, keyed by (color, full_circle, TILE_SIZE)
+ghost_sprites = {}
+
+
+def create_ghost_image(color, full_circle=False):
+    image = surface_counter.add(pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA))
+    if full_circle:
+        pygame.draw.circle(image, color, (TILE_SIZE // 2, TILE_SIZE // 2), TILE_SIZE // 2)
+        if color == BLACK:
+            pygame.draw.circle(image, WHITE, (TILE_SIZE // 2, TILE_SIZE // 2), TILE_SIZE // 2, int(2 * SCALE_FACTOR))
+    else:
+        pygame.draw.circle(image, color, (TILE_SIZE // 2, TILE_SIZE // 2), TILE_SIZE // 2, int(2 * SCALE_FACTOR))
+        if color == BLACK:
+            pygame.draw.circle(image, WHITE, (TILE_SIZE // 2, TILE_SIZE // 2), TILE_SIZE // 2, int(2 * SCALE_FACTOR))
+            pygame.draw.circle(image, BLACK, (TILE_SIZE // 2, TILE_SIZE // 2), TILE_SIZE // 2 - int(2 * SCALE_FACTOR), int(2 * SCALE_FACTOR))
+    return image
+
+
+def get_ghost_sprite(color, full_circle=False):
+    key = (color, full_circle, TILE_SIZE)
+    image = ghost_sprites.get(key)
+    if image is None:
+        image = ghost_sprites[key] = create_ghost_image(color, full_circle)
+    return image
+
+
+# Images ready to blit, keyed by (path, size); shared by every Maze, PacMan and reset
+image_cache = {}
+atlas_index = None  # Parsed ATLAS_INDEX, {} when missing or built for another SCALE_FACTOR
+atlas_surface = None  # Decoded ATLAS_IMAGE, loaded on the first atlas hit
+asset_load_times = {}  # Path -> seconds spent decoding it, reported by telemetry
+
+
+def load_atlas_index():
+    global atlas_index
+    if atlas_index is None:
+        atlas_index = {}
+        try:
+            with open(ATLAS_INDEX) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = None
+        if index and index.get('scale_factor') == SCALE_FACTOR:
+            atlas_index = index
+    return atlas_index
+
+
+def load_image(path, size):
+    global atlas_surface
+    key = (path, size)
+    image = image_cache.get(key)
+    if image is None:
+        entry = load_atlas_index().get('images', {}).get(path)
+        if entry is not None and tuple(entry[2:]) == size:
+            if atlas_surface is None:
+                started = time.perf_counter()
+                atlas_surface = surface_counter.add(pygame.image.load(ATLAS_IMAGE).convert_alpha())
+                asset_load_times[ATLAS_IMAGE] = time.perf_counter() - started
+            image = atlas_surface.subsurface(entry)
+        else:
+            started = time.perf_counter()
+            image = pygame.image.load(path).convert_alpha()
+            image = pygame.transform.scale(image, size)
+            asset_load_times[path] = time.perf_counter() - started
+        image = image_cache[key] = surface_counter.add(image)
+    return image
+
+
+def pellet_image_files(sports_balls_dir=SPORTS_BALLS_DIR):
+    # Only the file names are needed to pick pellet images, so headless games skip decoding
+    pellets = load_atlas_index().get('pellets')
+    if pellets is not None:
+        return pellets
+    return [f"{sports_balls_dir}/{filename}" for filename in sorted(os.listdir(sports_balls_dir)) if filename.endswith('.png')]
 
-# Initialize Pygame
-pygame.init()
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Pac-Man")
-clock = pygame.time.Clock()
-font = pygame.font.Font(None, FONT_SIZE)
 
 class Maze:
-    def __init__(self, layout):
-        self.layout = layout
-        self.walls = []
-        self.dots = []
-        self.power_pellets = []
-        self.junctions = []
-        self.load_power_pellet_images()
+    def __init__(self, level, rng=random):
+        self.level = level  # levels.Level, compiled from a level file or layout rows
+        self.rng = rng
+        self.remaining = 0  # Dots and power pellets left to collect
+        self.junctions = set()  # Pixel positions of tiles with 3+ open neighbours
+        self.move_masks = {}  # Pixel position key -> DIRECTION_BITS of legal moves, see move_mask
+        self.background = None  # Cached static layer, see render_background
+        self.node_index = None  # Navigation graph, built on first use, see build_navigation
+        self.initial_background = None  # Walls, all dots and extras, copied into background on reset
+        self.erased_rects = []  # Eaten items not yet cleared from the screen
+        self.pellet_files = pellet_image_files()
+        self.pellet_images = None  # Loaded on the first render_background
         self.create_maze()
         # Removed background loading
 
     def load_power_pellet_images(self):
         self.pellet_images = []
-        sports_balls_dir = "sports_balls"
         # Load all images from the 'sports_balls' directory
-        for filename in os.listdir(sports_balls_dir):
-            if filename.endswith('.png'):
-                image = pygame.image.load(os.path.join(sports_balls_dir, filename)).convert_alpha()
-                image = pygame.transform.scale(image, (int(12 * SCALE_FACTOR), int(12 * SCALE_FACTOR)))
-                self.pellet_images.append(image)
+        for path in self.pellet_files:
+            self.pellet_images.append(load_image(path, PELLET_IMAGE_SIZE))
         if not self.pellet_images:
             # If no images found, use a default circle
-            default_image = pygame.Surface((int(12 * SCALE_FACTOR), int(12 * SCALE_FACTOR)), pygame.SRCALPHA)
+            default_image = surface_counter.add(pygame.Surface((int(12 * SCALE_FACTOR), int(12 * SCALE_FACTOR)), pygame.SRCALPHA))
             pygame.draw.circle(default_image, WHITE, (int(6 * SCALE_FACTOR), int(6 * SCALE_FACTOR)), int(6 * SCALE_FACTOR))
             self.pellet_images.append(default_image)
 
     def create_maze(self):
-        maze_width = len(self.layout[0])
-        maze_height = len(self.layout)
-        for y, row in enumerate(self.layout):
-            for x, col in enumerate(row):
-                if col == '#':
-                    self.walls.append(pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE))
-                elif col == '.':
-                    self.dots.append(pygame.Rect(x * TILE_SIZE + int(6 * SCALE_FACTOR), y * TILE_SIZE + int(6 * SCALE_FACTOR), int(4 * SCALE_FACTOR), int(4 * SCALE_FACTOR)))
-                elif col == 'o':
-                    pellet_rect = pygame.Rect(x * TILE_SIZE + int(2 * SCALE_FACTOR), y * TILE_SIZE + int(2 * SCALE_FACTOR), int(12 * SCALE_FACTOR), int(12 * SCALE_FACTOR))
-                    image = random.choice(self.pellet_images)
-                    self.power_pellets.append({'rect': pellet_rect, 'image': image})
+        # Everything comes precompiled from the level; only copies are made here
+        level = self.level
+        self.width = level.width
+        self.height = level.height
+        # One byte per tile, indexed y * width + x: 1 for walls, used for collision queries
+        self.wall_grid = bytearray(level.wall_grid)
+        # 1 where a dot is left; 0, or 1 + index into pellet_images, for pellets
+        self.initial_dot_grid = level.dot_grid
+        self.dot_grid = bytearray(level.dot_grid)
+        self.pellet_grid = bytearray(self.width * self.height)
+        # Tile indices of the layout's dots and pellets in scan order; reset() restores from these
+        self.dot_tiles = level.dot_tiles
+        self.pellet_tiles = level.pellet_tiles
+        # Spawns in pixels; the level keeps them in half tiles
+        self.pacman_start = (level.pacman_spawn[0] * TILE_SIZE // 2, level.pacman_spawn[1] * TILE_SIZE // 2)
+        self.ghost_starts = [(x * TILE_SIZE // 2, y * TILE_SIZE // 2) for x, y in level.ghost_spawns]
+        self.ghost_box = level.ghost_box
+        self.reset()
 
         # Identify junctions
         self.identify_junctions()
 
+    def reset(self):
+        # Put every dot and pellet back without re-parsing the layout
+        self.dot_grid[:] = self.initial_dot_grid
+        for index in self.pellet_tiles:
+            # Index into pellet_images, picked here so the RNG stream does not depend on rendering
+            self.pellet_grid[index] = 1 + self.rng.choice(range(max(len(self.pellet_files), 1)))
+        self.remaining = len(self.dot_tiles) + len(self.pellet_tiles)
+        self.erased_rects.clear()
+
     def identify_junctions(self):
-        maze_width = len(self.layout[0])
-        maze_height = len(self.layout)
-        for y in range(maze_height):
-            for x in range(maze_width):
-                if self.layout[y][x] != '#':
-                    directions = 0
-                    for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                        nx, ny = x + dx, y + dy
-                        if 0 <= nx < maze_width and 0 <= ny < maze_height:
-                            if self.layout[ny][nx] != '#':
-                                directions += 1
-                    if directions >= 3:
-                        self.junctions.append((x * TILE_SIZE, y * TILE_SIZE))
+        # Tiles with 3+ open neighbours, found when the level was compiled
+        self.junction_grid = bytearray(self.width * self.height)
+        for index in self.level.junctions:
+            self.junctions.add((index % self.width * TILE_SIZE, index // self.width * TILE_SIZE))
+            # Same junctions by tile index, for lookups that should not build tuples
+            self.junction_grid[index] = 1
+
+    def build_navigation(self, max_cached_rows=256):
+        # Graph over open tiles: node ids, adjacency, corridor segments between
+        # junctions, and BFS distance rows computed on demand and cached. It takes
+        # a pass over every tile, so only chase ghosts pay for it, on first use
+        self.node_index = array('i', [-1]) * (self.width * self.height)
+        self.node_tiles = []
+        for y in range(self.height):
+            for x in range(self.width):
+                if not self.wall_grid[y * self.width + x]:
+                    self.node_index[y * self.width + x] = len(self.node_tiles)
+                    self.node_tiles.append((x, y))
+        self.neighbours = []
+        for x, y in self.node_tiles:
+            self.neighbours.append(tuple(
+                self.node_index[ny * self.width + nx]
+                for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1))
+                if 0 <= nx < self.width and 0 <= ny < self.height and self.node_index[ny * self.width + nx] >= 0
+            ))
+        self.build_segments()
+        # Two bytes per distance unless the maze is too big for them
+        self.distance_typecode = 'H' if len(self.node_tiles) < 0xFFFF else 'I'
+        self.unreachable = 0xFFFF if self.distance_typecode == 'H' else 0xFFFFFFFF
+        self.distance_rows = OrderedDict()
+        self.max_cached_rows = max_cached_rows
+
+    def build_segments(self):
+        # Corridors as node lists running from one junction or dead end to the next.
+        # Border tiles also end a corridor: off the grid counts as open, so they are exits
+        is_stop = [len(links) != 2 or x in (0, self.width - 1) or y in (0, self.height - 1)
+                   for links, (x, y) in zip(self.neighbours, self.node_tiles)]
+        self.segments = []
+        self.segment_of = array('i', [-1]) * len(self.node_tiles)
+        for start, links in enumerate(self.neighbours):
+            if not is_stop[start]:
+                continue
+            for node in links:
+                if is_stop[node]:
+                    if node < start:
+                        continue  # Two adjacent stops; stored once, from the lower id
+                elif self.segment_of[node] >= 0:
+                    continue  # Already walked from the other end
+                segment = [start]
+                previous = start
+                while not is_stop[node]:
+                    segment.append(node)
+                    previous, node = node, next(n for n in self.neighbours[node] if n != previous)
+                segment.append(node)
+                for inner in segment[1:-1]:
+                    self.segment_of[inner] = len(self.segments)
+                self.segments.append(segment)
+
+    def tile_node(self, tile_x, tile_y):
+        if self.node_index is None:
+            self.build_navigation()
+        if 0 <= tile_x < self.width and 0 <= tile_y < self.height:
+            return self.node_index[tile_y * self.width + tile_x]
+        return -1
+
+    def distances_from(self, tile):
+        # Steps from tile to every node, by breadth-first search; rows are cached
+        node = self.tile_node(*tile)
+        row = self.distance_rows.get(node)
+        if row is not None:
+            self.distance_rows.move_to_end(node)
+            return row
+        row = array(self.distance_typecode, [self.unreachable]) * len(self.node_tiles)
+        row[node] = 0
+        queue = deque([node])
+        while queue:
+            current = queue.popleft()
+            step = row[current] + 1
+            for neighbour in self.neighbours[current]:
+                if row[neighbour] == self.unreachable:
+                    row[neighbour] = step
+                    queue.append(neighbour)
+        self.distance_rows[node] = row
+        if len(self.distance_rows) > self.max_cached_rows:
+            self.distance_rows.popitem(last=False)
+        return row
+
+    def distance(self, from_tile, to_tile):
+        node = self.tile_node(*from_tile)
+        if node < 0 or self.tile_node(*to_tile) < 0:
+            return self.unreachable
+        return self.distances_from(to_tile)[node]
+
+    def nearest_open_tile(self, tile):
+        # Closest non-wall tile by grid distance, e.g. for corner targets
+        if self.node_index is None:
+            self.build_navigation()
+        return min(self.node_tiles, key=lambda open_tile: abs(open_tile[0] - tile[0]) + abs(open_tile[1] - tile[1]))
+
+    def is_wall(self, tile_x, tile_y):
+        # Tiles outside the layout are open, like the original wall list
+        if 0 <= tile_x < self.width and 0 <= tile_y < self.height:
+            return self.wall_grid[tile_y * self.width + tile_x] == 1
+        return False
+
+    def collides(self, x, y, w=TILE_SIZE, h=TILE_SIZE):
+        # Only check the tiles the rectangle overlaps
+        if w <= 0 or h <= 0:
+            return False
+        left = x // TILE_SIZE
+        right = (x + w - 1) // TILE_SIZE
+        top = y // TILE_SIZE
+        bottom = (y + h - 1) // TILE_SIZE
+        for tile_y in range(top, bottom + 1):
+            for tile_x in range(left, right + 1):
+                if self.is_wall(tile_x, tile_y):
+                    return True
+        return False
+
+    def rect_collides(self, rect):
+        return self.collides(rect.x, rect.y, rect.width, rect.height)
+
+    def can_move(self, rect, dx, dy):
+        # Same result as rect.move(dx, dy) tested against every wall
+        return not self.collides(rect.x + int(dx), rect.y + int(dy), rect.width, rect.height)
+
+    def move_mask(self, x, y):
+        # DIRECTION_BITS of the moves a tile-sized actor at (x, y) can make. Ghosts
+        # revisit the same positions constantly and crowds share them, so each
+        # position's wall scan is done once and then looked up
+        key = y * POSITION_STRIDE + x
+        mask = self.move_masks.get(key)
+        if mask is None:
+            mask = 0
+            for direction in GHOST_DIRECTIONS:
+                dx, dy = DIRECTION_STEPS[direction]
+                if not self.collides(x + dx, y + dy):
+                    mask |= DIRECTION_BITS[direction]
+            if len(self.move_masks) >= MAX_MOVE_MASKS:
+                self.move_masks.clear()
+            self.move_masks[key] = mask
+        return mask
+
+    def tile_index(self, tile_x, tile_y):
+        if 0 <= tile_x < self.width and 0 <= tile_y < self.height:
+            return tile_y * self.width + tile_x
+        return -1
+
+    def has_dot(self, tile_x, tile_y):
+        index = self.tile_index(tile_x, tile_y)
+        return index >= 0 and self.dot_grid[index] == 1
+
+    def has_pellet(self, tile_x, tile_y):
+        index = self.tile_index(tile_x, tile_y)
+        return index >= 0 and self.pellet_grid[index] != 0
+
+    def dot_rect(self, index):
+        return pygame.Rect(index % self.width * TILE_SIZE + DOT_OFFSET, index // self.width * TILE_SIZE + DOT_OFFSET, DOT_SIZE, DOT_SIZE)
+
+    def pellet_rect(self, index):
+        return pygame.Rect((index % self.width * TILE_SIZE + PELLET_OFFSET, index // self.width * TILE_SIZE + PELLET_OFFSET), PELLET_IMAGE_SIZE)
+
+    def eat_dot(self, tile_x, tile_y, rect):
+        # Eat the dot on this tile if rect overlaps it, like rect.colliderect(dot)
+        index = self.tile_index(tile_x, tile_y)
+        if index < 0 or not self.dot_grid[index]:
+            return False
+        left = tile_x * TILE_SIZE + DOT_OFFSET
+        top = tile_y * TILE_SIZE + DOT_OFFSET
+        if rect.x < left + DOT_SIZE and left < rect.right and rect.y < top + DOT_SIZE and top < rect.bottom:
+            self.dot_grid[index] = 0
+            self.remaining -= 1
+            if self.background is not None:
+                self.erase(self.dot_rect(index))
+            return True
+        return False
+
+    def eat_power_pellet(self, tile_x, tile_y, rect):
+        index = self.tile_index(tile_x, tile_y)
+        if index < 0 or not self.pellet_grid[index]:
+            return False
+        left = tile_x * TILE_SIZE + PELLET_OFFSET
+        top = tile_y * TILE_SIZE + PELLET_OFFSET
+        if rect.x < left + PELLET_IMAGE_SIZE[0] and left < rect.right and rect.y < top + PELLET_IMAGE_SIZE[1] and top < rect.bottom:
+            self.pellet_grid[index] = 0
+            self.remaining -= 1
+            if self.background is not None:
+                self.erase(self.pellet_rect(index))
+            return True
+        return False
+
+    def erase(self, rect):
+        # Remove an eaten item from the cached background
+        if self.background is not None:
+            self.background.fill(BLACK, rect)
+            self.erased_rects.append(rect)
 
     def is_junction(self, rect):
-        return (rect.x, rect.y) in self.junctions
+        x, y = rect.x, rect.y
+        if x % TILE_SIZE or y % TILE_SIZE:
+            return False
+        index = self.tile_index(x // TILE_SIZE, y // TILE_SIZE)
+        return index >= 0 and self.junction_grid[index] == 1
 
-    def draw(self, surface):
-        # Fill the background with black
-        surface.fill(BLACK)
-        for wall in self.walls:
-            pygame.draw.rect(surface, GLOWING_YELLOW, (wall.x + int(2 * SCALE_FACTOR), wall.y + int(2 * SCALE_FACTOR), TILE_SIZE - int(4 * SCALE_FACTOR), TILE_SIZE - int(4 * SCALE_FACTOR)))
+    def render_background(self, extras=()):
+        # Walls and dots are drawn once, together with extras such as the banner;
+        # later calls restore that layer in place and only re-blit the pellets,
+        # whose images are picked again on every reset
+        if self.initial_background is None:
+            self.load_power_pellet_images()
+            self.initial_background = surface_counter.add(pygame.Surface((WIDTH, HEIGHT)).convert())
+            self.draw_walls(self.initial_background)
+            for index in self.dot_tiles:
+                pygame.draw.rect(self.initial_background, WHITE, self.dot_rect(index))
+            for image, rect in extras:
+                self.initial_background.blit(image, rect)
+            self.background = surface_counter.add(self.initial_background.copy())
+        else:
+            self.background.blit(self.initial_background, (0, 0))
+        for index in self.dot_tiles:
+            if not self.dot_grid[index]:
+                self.background.fill(BLACK, self.dot_rect(index))
+        self.draw_pellets(self.background)
+        return self.background
 
-        for dot in self.dots:
-            pygame.draw.rect(surface, WHITE, dot)
+    def draw_walls(self, surface):
+        for index, wall in enumerate(self.wall_grid):
+            if wall:
+                x, y = index % self.width * TILE_SIZE, index // self.width * TILE_SIZE
+                pygame.draw.rect(surface, GLOWING_YELLOW, (x + int(2 * SCALE_FACTOR), y + int(2 * SCALE_FACTOR), TILE_SIZE - int(4 * SCALE_FACTOR), TILE_SIZE - int(4 * SCALE_FACTOR)))
 
-        for pellet in self.power_pellets:
-            surface.blit(pellet['image'], pellet['rect'])
+    def draw_pellets(self, surface):
+        if self.pellet_images is None:
+            self.load_power_pellet_images()
+        for index in self.pellet_tiles:
+            kind = self.pellet_grid[index]
+            if kind:
+                surface.blit(self.pellet_images[kind - 1], self.pellet_rect(index))
 
 class PacMan:
+    __slots__ = ('rect', 'direction', 'next_direction', 'score', 'lives', 'power_mode', 'power_timer', 'has_moved')
+
     def __init__(self, position):
-        self.image = pygame.image.load("WSC SPORTS_Logo_03_White.png").convert_alpha()
-        self.image = pygame.transform.scale(self.image, (TILE_SIZE, TILE_SIZE))
-        self.rect = self.image.get_rect(topleft=position)
-        self.direction = pygame.Vector2(0, 0)
-        self.next_direction = pygame.Vector2(0, 0)
-        self.speed = 2 * SCALE_FACTOR
+        self.rect = pygame.Rect(position, (TILE_SIZE, TILE_SIZE))
+        self.reset(position)
+
+    def reset(self, position):
+        # Back to a new game's state, reusing this object
+        self.rect.topleft = position
+        self.direction = STOP  # Direction codes, see DIRECTION_VECTORS
+        self.next_direction = STOP
         self.score = 0
         self.lives = 3
         self.power_mode = False
         self.power_timer = 0
         self.has_moved = False  # Track if the player has made a move
 
-    def update(self, maze):
-        self.handle_input()
+    def update(self, maze, action=ACTION_NONE):
+        self.handle_input(action)
         self.move(maze)
         self.check_collisions(maze)
         self.update_power_mode()
 
-    def handle_input(self):
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_LEFT]:
-            self.next_direction = pygame.Vector2(-1, 0)
-            self.has_moved = True
-        elif keys[pygame.K_RIGHT]:
-            self.next_direction = pygame.Vector2(1, 0)
-            self.has_moved = True
-        elif keys[pygame.K_UP]:
-            self.next_direction = pygame.Vector2(0, -1)
-            self.has_moved = True
-        elif keys[pygame.K_DOWN]:
-            self.next_direction = pygame.Vector2(0, 1)
+    def handle_input(self, action):
+        direction = ACTION_DIRECTIONS.get(action)
+        if direction is not None:
+            self.next_direction = direction
             self.has_moved = True
+        elif action == ACTION_CANCEL_TURN:
+            self.next_direction = self.direction
 
     def move(self, maze):
         # Try to turn if possible
@@ -141,25 +572,26 @@ class PacMan:
             self.direction = self.next_direction
         # Move in current direction if possible
         if self.can_move(self.direction, maze):
-            self.rect.move_ip(self.direction.x * self.speed, self.direction.y * self.speed)
+            dx, dy = DIRECTION_STEPS[self.direction]
+            self.rect.move_ip(dx, dy)
 
     def can_move(self, direction, maze):
-        new_rect = self.rect.move(direction.x * self.speed, direction.y * self.speed)
-        return not any(new_rect.colliderect(wall) for wall in maze.walls)
+        dx, dy = DIRECTION_STEPS[direction]
+        return maze.can_move(self.rect, dx, dy)
 
     def check_collisions(self, maze):
-        # Collect dots
-        for dot in maze.dots[:]:
-            if self.rect.colliderect(dot):
-                maze.dots.remove(dot)
-                self.score += 10
-        # Collect power pellets
-        for pellet in maze.power_pellets[:]:
-            if self.rect.colliderect(pellet['rect']):
-                maze.power_pellets.remove(pellet)
-                self.score += 50
-                self.power_mode = True
-                self.power_timer = POWER_PELLET_DURATION
+        # Dots and pellets sit fully inside one tile, so only the tiles under Pac-Man matter
+        rect = self.rect
+        for tile_y in range(rect.y // TILE_SIZE, (rect.bottom - 1) // TILE_SIZE + 1):
+            for tile_x in range(rect.x // TILE_SIZE, (rect.right - 1) // TILE_SIZE + 1):
+                # Collect dots
+                if maze.eat_dot(tile_x, tile_y, rect):
+                    self.score += 10
+                # Collect power pellets
+                if maze.eat_power_pellet(tile_x, tile_y, rect):
+                    self.score += 50
+                    self.power_mode = True
+                    self.power_timer = POWER_PELLET_DURATION
 
     def update_power_mode(self):
         if self.power_mode:
@@ -167,229 +599,544 @@ class PacMan:
             if self.power_timer <= 0:
                 self.power_mode = False
 
-    def draw(self, surface):
-        surface.blit(self.image, self.rect)
+    def draw(self, surface, rect=None):
+        # rect overrides where to draw, for interpolated rendering
+        surface.blit(load_image(PACMAN_IMAGE, (TILE_SIZE, TILE_SIZE)), rect or self.rect)
 
 class Ghost:
-    def __init__(self, position, color):
+    __slots__ = ('start_pos', 'color', 'mode', 'scatter_tile', 'full_circle', 'rect', 'direction', 'previous_direction',
+                 'visible', 'blink_timer', 'power_mode')
+
+    def __init__(self, position, color, mode='random', scatter_tile=None):
         self.start_pos = position
         self.color = color
-        self.image = self.create_ghost_image()
-        self.rect = self.image.get_rect(topleft=position)
-        self.direction = pygame.Vector2(0, 0)
+        self.mode = mode  # 'random' or 'chase'
+        self.scatter_tile = scatter_tile  # Corner the ghost heads for when scattering
+        self.full_circle = False  # Drawn filled while power mode is on
+        self.rect = pygame.Rect(position, (TILE_SIZE, TILE_SIZE))
+        self.direction = STOP
         self.previous_direction = self.direction
-        self.speed = 2 * SCALE_FACTOR
         self.visible = True
         self.blink_timer = 0
         self.power_mode = False
 
     def create_ghost_image(self, full_circle=False):
-        image = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
-        if full_circle:
-            pygame.draw.circle(image, self.color, (TILE_SIZE // 2, TILE_SIZE // 2), TILE_SIZE // 2)
-            if self.color == BLACK:
-                pygame.draw.circle(image, WHITE, (TILE_SIZE // 2, TILE_SIZE // 2), TILE_SIZE // 2, int(2 * SCALE_FACTOR))
-        else:
-            pygame.draw.circle(image, self.color, (TILE_SIZE // 2, TILE_SIZE // 2), TILE_SIZE // 2, int(2 * SCALE_FACTOR))
-            if self.color == BLACK:
-                pygame.draw.circle(image, WHITE, (TILE_SIZE // 2, TILE_SIZE // 2), TILE_SIZE // 2, int(2 * SCALE_FACTOR))
-                pygame.draw.circle(image, BLACK, (TILE_SIZE // 2, TILE_SIZE // 2), TILE_SIZE // 2 - int(2 * SCALE_FACTOR), int(2 * SCALE_FACTOR))
-        return image
+        # Sprites are cached per color, so this never allocates after the first call
+        return get_ghost_sprite(self.color, full_circle)
 
-    def update(self, maze, power_mode, player_moved):
+    def update(self, maze, power_mode, player_moved, rng=random, target=None):
         self.power_mode = power_mode
         if player_moved:
-            self.move(maze)
+            self.move(maze, rng, target)
         self.handle_blinking()
 
-    def move(self, maze):
+    def move(self, maze, rng=random, target=None):
         # Mark previous movement as x
         x = self.direction
 
-        # Calculate optional movements that do not collide with walls
-        possible_directions = []
-        for direction in [pygame.Vector2(1, 0), pygame.Vector2(-1, 0), pygame.Vector2(0, 1), pygame.Vector2(0, -1)]:
-            new_rect = self.rect.move(direction.x * self.speed, direction.y * self.speed)
-            if not any(new_rect.colliderect(wall) for wall in maze.walls):
-                possible_directions.append(direction)
+        # Calculate optional movements that do not collide with walls, as DIRECTION_BITS
+        possible_directions = maze.move_mask(self.rect.x, self.rect.y)
 
         if not possible_directions:
             # If no possible movements, stay in place
-            self.direction = pygame.Vector2(0, 0)
+            self.direction = STOP
             return
 
         # Check if at a junction
         at_junction = maze.is_junction(self.rect)
 
-        if at_junction:
+        if self.mode == 'chase' and target is not None and not self.power_mode:
+            # Frightened ghosts keep the random walk below
+            self.direction = self.towards(maze, x, possible_directions, target)
+        elif at_junction:
             # At junction, with 70% probability, keep moving in same direction if possible
-            if x in possible_directions and random.random() < 0.7:
+            if possible_directions & DIRECTION_BITS[x] and rng.random() < 0.7:
                 self.direction = x
             else:
                 # Choose other legal directions uniformly
-                other_directions = [d for d in possible_directions if d != x]
+                other_directions = possible_directions & ~DIRECTION_BITS[x]
                 if other_directions:
-                    self.direction = random.choice(other_directions)
+                    self.direction = rng.choice(DIRECTIONS_IN_MASK[other_directions])
                 else:
                     self.direction = x
         else:
             # Decide on next movement
-            if x in possible_directions and random.random() < 0.99:
+            if possible_directions & DIRECTION_BITS[x] and rng.random() < 0.99:
                 # Keep moving in the same direction with 99% probability
                 self.direction = x
             else:
                 # Choose a new direction
-                self.direction = random.choice(possible_directions)
+                self.direction = rng.choice(DIRECTIONS_IN_MASK[possible_directions])
 
         # Move in the chosen direction
-        self.rect.move_ip(self.direction.x * self.speed, self.direction.y * self.speed)
+        dx, dy = DIRECTION_STEPS[self.direction]
+        self.rect.move_ip(dx, dy)
 
         # Update previous direction
         self.previous_direction = self.direction
 
+    def towards(self, maze, x, possible_directions, target):
+        # Pick the legal direction whose next tile is closest to target, using the
+        # maze's cached distance rows; reverse only when there is no other way
+        forward = possible_directions & ~DIRECTION_BITS[REVERSE[x]] or possible_directions
+        aligned = self.rect.x % TILE_SIZE == 0 and self.rect.y % TILE_SIZE == 0
+        if not aligned and forward & DIRECTION_BITS[x]:
+            return x
+        if aligned and x != STOP:
+            node = maze.tile_node(self.rect.x // TILE_SIZE, self.rect.y // TILE_SIZE)
+            if maze.segment_of[node] >= 0:
+                # Inside a corridor segment the only way on is along it; no distances needed
+                return DIRECTIONS_IN_MASK[forward][0]
+        distances = maze.distances_from(target)
+        reach = TILE_SIZE // 2 + 1
+        best, best_distance = STOP, None
+        for direction in DIRECTIONS_IN_MASK[forward]:
+            dx, dy = DIRECTION_VECTORS[direction]
+            node = maze.tile_node((self.rect.centerx + dx * reach) // TILE_SIZE, (self.rect.centery + dy * reach) // TILE_SIZE)
+            distance = distances[node] if node >= 0 else maze.unreachable
+            if best_distance is None or distance < best_distance:
+                best, best_distance = direction, distance
+        return best
+
     def handle_blinking(self):
         if self.power_mode:
             self.blink_timer = (self.blink_timer + 1) % 30  # Adjust blink speed here
             self.visible = self.blink_timer < 15  # Visible for half the time
             # Change to full circle shape
-            self.image = self.create_ghost_image(full_circle=True)
+            self.full_circle = True
         else:
             self.visible = True
             # Reset to ring shape
-            self.image = self.create_ghost_image(full_circle=False)
+            self.full_circle = False
 
-    def draw(self, surface):
+    def draw(self, surface, rect=None):
         if self.visible:
-            surface.blit(self.image, self.rect)
+            surface.blit(self.create_ghost_image(self.full_circle), rect or self.rect)
 
     def reset_position(self):
         self.rect.topleft = self.start_pos
-        self.direction = pygame.Vector2(0, 0)
+        self.direction = STOP
 
-class Game:
-    def __init__(self):
-        self.maze = Maze(self.load_maze())
-        self.pacman = PacMan((13 * TILE_SIZE, 23 * TILE_SIZE))
-        self.ghosts = self.create_ghosts()
-        self.running = True
-        self.state = 'playing'  # Can be 'playing', 'game_over', 'won'
-        self.start_time = None  # Will be set after first move
-        self.time_left = GAME_TIME
-        self.load_buttom_image()  # Load the 'buttom.png' image
+    def reset(self):
+        # Back to a new game's state, reusing this object
+        self.reset_position()
+        self.previous_direction = self.direction
+        self.visible = True
+        self.blink_timer = 0
+        self.power_mode = False
+        self.full_circle = False
+
+class GhostGrid:
+    # Uniform-grid broad phase: ghost indices bucketed by the tile under their
+    # top-left corner, moved between buckets only when they cross a tile edge
+    def __init__(self, ghosts):
+        self.ghosts = ghosts
+        self.cells = {}  # Tile key -> list of ghost indices
+        self.cell_of = [0] * len(ghosts)
+        self.rebuild()
+
+    def rebuild(self):
+        self.cells.clear()
+        for index, ghost in enumerate(self.ghosts):
+            key = ghost.rect.y // TILE_SIZE * POSITION_STRIDE + ghost.rect.x // TILE_SIZE
+            self.cell_of[index] = key
+            bucket = self.cells.get(key)
+            if bucket is None:
+                self.cells[key] = [index]
+            else:
+                bucket.append(index)
+
+    def move(self, index, rect):
+        key = rect.y // TILE_SIZE * POSITION_STRIDE + rect.x // TILE_SIZE
+        old = self.cell_of[index]
+        if key == old:
+            return
+        bucket = self.cells[old]
+        bucket.remove(index)
+        if not bucket:
+            del self.cells[old]
+        self.cell_of[index] = key
+        bucket = self.cells.get(key)
+        if bucket is None:
+            self.cells[key] = [index]
+        else:
+            bucket.append(index)
+
+    def first_overlap(self, rect, after=-1):
+        # Lowest ghost index above after whose tile-sized rect overlaps rect, or -1
+        best = -1
+        for tile_y in range((rect.y - TILE_SIZE + 1) // TILE_SIZE, (rect.bottom - 1) // TILE_SIZE + 1):
+            for tile_x in range((rect.x - TILE_SIZE + 1) // TILE_SIZE, (rect.right - 1) // TILE_SIZE + 1):
+                bucket = self.cells.get(tile_y * POSITION_STRIDE + tile_x)
+                if bucket is None:
+                    continue
+                for index in bucket:
+                    if after < index and (best < 0 or index < best) and rect.colliderect(self.ghosts[index].rect):
+                        best = index
+        return best
 
-    def load_buttom_image(self):
-        # Load and scale the buttom image
-        self.buttom_image = pygame.image.load("buttom.png").convert_alpha()
-        self.buttom_image = pygame.transform.scale(self.buttom_image, (WIDTH, int(50 * SCALE_FACTOR)))
-        self.buttom_rect = self.buttom_image.get_rect(midbottom=(WIDTH // 2, HEIGHT))
 
-    def load_maze(self):
-        maze_layout = [
-            "############################",
-            "#o...........##...........o#",
-            "#.####.#####.##.#####.####.#",
-            "#.####.#####.##.#####.####.#",
-            "#..........................#",
-            "#.####.##.########.##.####.#",
-            "#......##....##....##......#",
-            "######.##### ## #####.######",
-            "     #.##### ## #####.#     ",
-            "     #.##          ##.#     ",
-            "     #.## ##----## ##.#     ",
-            "######.## #      # ##.######",
-            "#     .   #      #   .     #",
-            "######.## ###--### ##.######",
-            "     #.##          ##.#     ",
-            "     #.## ######## ##.#     ",
-            "######.## ######## ##.######",
-            "#............##............#",
-            "#.####.#####.##.#####.####.#",
-            "#...##....o.........#....#.#",
-            "###.##.##.########.##.##.###",
-            "#......##....##....##......#",
-            "#.##########.##.##########.#",
-            "#o........................o#",
-            "############################",
-        ]
-        return maze_layout
+def load_maze():
+    # Rows of the default level, for callers that build layouts by hand
+    return read_layout(DEFAULT_LEVEL)
+
+
+class Simulation:
+    # Game rules only: stepped one tick at a time from an explicit action, with
+    # its own seeded RNG and no display, clock or keyboard access
+    def __init__(self, seed=None, ghost_count=len(GHOST_COLORS), layout=None, game_time=GAME_TIME, ghost_mode=GHOST_MODE,
+                 profiler=None):
+        self.ghost_count = ghost_count
+        self.profiler = profiler  # Optional FrameProfiler, marked after each phase of step
+        # Per-ghost profiler phases, or one for all of them in crowds
+        self.ghost_phases = [f"ghost {i}" for i in range(ghost_count)] if ghost_count <= len(GHOST_COLORS) else None
+        self.ghost_mode = ghost_mode
+        self.layout = layout  # levels.Level, layout rows, or None for the default level
+        self.game_time = game_time
+        # Every game runs from a known seed, so a replay of its actions reproduces it
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        self.rng = random.Random(self.seed)
+        self.recorder = None  # Optional replay.ReplayRecorder, given every tick's action
+        self.maze = None
+        self.pacman = None
+        self.ghosts = []
+        self.reset()
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed = seed
+            self.rng.seed(seed)
+        if self.maze is None:
+            self.maze = Maze(as_level(self.layout), self.rng)
+            self.pacman = PacMan(self.maze.pacman_start)
+            self.ghosts = self.create_ghosts()
+            self.ghost_rects = [ghost.rect for ghost in self.ghosts]  # Same Rect objects, for collidelist
+            self.use_ghost_grid(self.ghost_count >= GHOST_GRID_MIN_GHOSTS)
+        else:
+            # Same layout and actors: restore state in place, no parsing or allocation
+            self.maze.reset()
+            self.pacman.reset(self.maze.pacman_start)
+            for ghost in self.ghosts:
+                ghost.reset()
+            if self.ghost_grid:
+                self.ghost_grid.rebuild()
+        self.state = 'playing'  # Can be 'playing', 'game_over', 'won'
+        self.tick = 0
+        self.start_tick = None  # Will be set after first move
+        self.time_left = self.game_time
+
+    def use_ghost_grid(self, enabled):
+        # Switch the ghost-player broad phase; collision outcomes are the same either way
+        self.ghost_grid = GhostGrid(self.ghosts) if enabled else None
 
     def create_ghosts(self):
-        ghost_colors = [
-            BLUE,
-            BLACK,
-            RED,
-            YELLOW,
-            GREEN
-        ]
-        # Position ghosts inside the ghost box on lines 12-13 (indices 11-12)
-        base_y = 11 * TILE_SIZE
-        base_x = 13 * TILE_SIZE  # Center x position
-
-        ghost_positions = [
-            (base_x - TILE_SIZE, base_y),          # Left position
-            (base_x, base_y),                      # Center position
-            (base_x + TILE_SIZE, base_y),          # Right position
-            (base_x - TILE_SIZE // 2, base_y + TILE_SIZE),  # Bottom left
-            (base_x + TILE_SIZE // 2, base_y + TILE_SIZE),  # Bottom right
-        ]
+        # Ghosts start at the level's spawn points, cycling through them if there are more ghosts
+        ghost_positions = self.maze.ghost_starts
+        corners = [(0, 0), (self.maze.width - 1, 0), (0, self.maze.height - 1), (self.maze.width - 1, self.maze.height - 1)]
+        if self.ghost_mode == 'chase':
+            corners = [self.maze.nearest_open_tile(corner) for corner in corners]
         ghosts = []
-        for pos, color in zip(ghost_positions, ghost_colors):
-            ghost = Ghost(pos, color)
+        for i in range(self.ghost_count):
+            scatter_tile = corners[i % len(corners)] if self.ghost_mode == 'chase' else None
+            ghost = Ghost(ghost_positions[i % len(ghost_positions)], GHOST_COLORS[i % len(GHOST_COLORS)], self.ghost_mode, scatter_tile)
             # Ensure ghosts are not inside walls
-            if not any(ghost.rect.colliderect(wall) for wall in self.maze.walls):
+            if not self.maze.rect_collides(ghost.rect):
                 ghosts.append(ghost)
             else:
-                # Adjust position if colliding
-                ghost.rect.topleft = self.find_valid_position()
+                # Adjust position if colliding, and return there after deaths and resets
+                ghost.start_pos = ghost.rect.topleft = self.find_valid_position()
                 ghosts.append(ghost)
         return ghosts
 
     def find_valid_position(self):
-        # Find a valid position inside the ghost box
-        x = 12 * TILE_SIZE
-        y = 11 * TILE_SIZE
-        while True:
-            rect = pygame.Rect(x, y, TILE_SIZE, TILE_SIZE)
-            if not any(rect.colliderect(wall) for wall in self.maze.walls):
-                return (x, y)
-            x += TILE_SIZE
-            if x > (15 * TILE_SIZE):
-                x = 12 * TILE_SIZE
-                y += TILE_SIZE
+        # First open tile in the ghost box's columns, scanning down from its top row
+        x0, y0, x1, _ = self.maze.ghost_box
+        for y in range(y0, self.maze.height):
+            for x in range(x0, x1 + 1):
+                if not self.maze.collides(x * TILE_SIZE, y * TILE_SIZE):
+                    return (x * TILE_SIZE, y * TILE_SIZE)
+        x, y = self.maze.nearest_open_tile((x0, y0))
+        return (x * TILE_SIZE, y * TILE_SIZE)
+
+    def step(self, action=ACTION_NONE):
+        profiler = self.profiler
+        if self.recorder is not None:
+            self.recorder.record(action)
+        self.tick += 1
+        self.pacman.update(self.maze, action)
+        self.pacman.update_power_mode()
+        player_moved = self.pacman.has_moved
+        if profiler:
+            profiler.mark('pacman')
+
+        if player_moved and self.start_tick is None:
+            self.start_tick = self.tick
+
+        target = self.ghost_target()
+        grid = self.ghost_grid
+        for i, ghost in enumerate(self.ghosts):
+            ghost.update(self.maze, self.pacman.power_mode, player_moved, self.rng, target or ghost.scatter_tile)
+            if grid:
+                grid.move(i, ghost.rect)
+            if profiler and self.ghost_phases:
+                profiler.mark(self.ghost_phases[i])
+        if profiler and not self.ghost_phases:
+            profiler.mark('ghosts')
+        self.check_collisions()
+        if profiler:
+            profiler.mark('check_collisions')
+        # Update timer; game_time is counted in ticks of 1 / FPS seconds
+        if self.start_tick is not None:
+            elapsed_time = (self.tick - self.start_tick) // FPS
+            self.time_left = max(0, self.game_time - elapsed_time)
+            if self.time_left <= 0:
+                self.state = 'game_over'
+        if profiler:
+            profiler.mark('timer')
+
+    def ghost_target(self):
+        # Chase mode: Pac-Man's tile while chasing, None while scattering to corners
+        if self.ghost_mode != 'chase':
+            return None
+        if self.start_tick is None or (self.tick - self.start_tick) % (GHOST_SCATTER_TICKS + GHOST_CHASE_TICKS) < GHOST_SCATTER_TICKS:
+            return None
+        # Pac-Man never overlaps a wall, so the tile under its centre is always open
+        return (self.pacman.rect.centerx // TILE_SIZE, self.pacman.rect.centery // TILE_SIZE)
 
     def check_collisions(self):
-        for ghost in self.ghosts:
-            if self.pacman.rect.colliderect(ghost.rect):
-                if self.pacman.power_mode:
-                    ghost.reset_position()
-                    self.pacman.score += 200
+        # Ghosts touching Pac-Man, in index order
+        grid = self.ghost_grid
+        i = self.first_ghost_hit()
+        while i >= 0:
+            ghost = self.ghosts[i]
+            if self.pacman.power_mode:
+                ghost.reset_position()
+                if grid:
+                    grid.move(i, ghost.rect)
+                self.pacman.score += 200
+            else:
+                self.pacman.lives -= 1
+                if self.pacman.lives <= 0:
+                    self.state = 'game_over'
                 else:
-                    self.pacman.lives -= 1
-                    if self.pacman.lives <= 0:
-                        self.state = 'game_over'
-                    else:
-                        self.reset_positions()
+                    self.reset_positions()
+            i = self.first_ghost_hit(i)
 
         # Check for win condition
-        if not self.maze.dots and not self.maze.power_pellets:
+        if self.maze.remaining == 0:
             self.state = 'won'
 
+    def first_ghost_hit(self, after=-1):
+        # Lowest index above after of a ghost overlapping Pac-Man, or -1
+        if self.ghost_grid:
+            return self.ghost_grid.first_overlap(self.pacman.rect, after)
+        if after < 0:
+            return self.pacman.rect.collidelist(self.ghost_rects)
+        hit = self.pacman.rect.collidelist(self.ghost_rects[after + 1:])
+        return hit + after + 1 if hit >= 0 else -1
+
     def reset_positions(self):
-        self.pacman.rect.topleft = (13 * TILE_SIZE, 23 * TILE_SIZE)
-        self.pacman.direction = pygame.Vector2(0, 0)
-        self.pacman.next_direction = pygame.Vector2(0, 0)
+        self.pacman.rect.topleft = self.maze.pacman_start
+        self.pacman.direction = STOP
+        self.pacman.next_direction = STOP
         self.pacman.has_moved = False
         for ghost in self.ghosts:
             ghost.reset_position()
+        if self.ghost_grid:
+            self.ghost_grid.rebuild()
+
+
+class InputQueue:
+    # pygame events pass through an asyncio queue into a one-deep turn buffer,
+    # which the fixed-step loop drains one action per step. Nothing is polled, so
+    # taps shorter than a frame still count
+    def __init__(self):
+        self.events = asyncio.Queue()  # (time received, pygame event)
+        self.held = []  # Actions of arrow keys held down, most recent last
+        self.turn = ACTION_NONE  # Requested turn not yet taken
+        self.expires = None  # When an untaken turn lapses; None while its key is held
+        self.requested = None  # Time of the request, until its turn is taken
+        self.taken = None  # Request time of a turn taken since the last presented frame
+        self.swipe_from = None  # Finger position a swipe is measured from
+
+    def pump(self):
+        # pygame does not expose SDL event timestamps, so events are stamped as they are read
+        now = time.perf_counter()
+        for event in pygame.event.get():
+            self.events.put_nowait((now, event))
+
+    def request(self, action, now, expires):
+        self.turn = action
+        self.expires = expires
+        self.requested = now
+
+    def handle(self, now, event):
+        # Returns True for events consumed as movement input
+        if event.type == pygame.KEYDOWN and event.key in KEY_ACTIONS:
+            self.held.append(KEY_ACTIONS[event.key])
+            self.request(KEY_ACTIONS[event.key], now, None)
+        elif event.type == pygame.KEYUP and event.key in KEY_ACTIONS:
+            action = KEY_ACTIONS[event.key]
+            if action in self.held:
+                self.held.remove(action)
+            if self.held:
+                self.request(self.held[-1], now, None)
+            elif action == self.turn:
+                self.expires = now + TURN_BUFFER_TIME
+        elif event.type == pygame.FINGERDOWN:
+            self.swipe_from = (event.x, event.y)
+        elif event.type == pygame.FINGERMOTION and self.swipe_from is not None:
+            dx, dy = event.x - self.swipe_from[0], event.y - self.swipe_from[1]
+            if max(abs(dx), abs(dy)) >= SWIPE_DISTANCE:
+                if abs(dx) > abs(dy):
+                    action = ACTION_RIGHT if dx > 0 else ACTION_LEFT
+                else:
+                    action = ACTION_DOWN if dy > 0 else ACTION_UP
+                self.request(action, now, now + TURN_BUFFER_TIME)
+                self.swipe_from = (event.x, event.y)  # Keep swiping without lifting the finger
+        elif event.type == pygame.FINGERUP:
+            self.swipe_from = None
+        else:
+            return False
+        return True
+
+    def next_action(self, now):
+        # The action for the next step: the pending turn, or a cancel once it lapses
+        if self.turn == ACTION_NONE:
+            return ACTION_NONE
+        if self.expires is not None and now > self.expires:
+            self.turn = ACTION_NONE
+            self.requested = None
+            return ACTION_CANCEL_TURN
+        return self.turn
+
+    def after_step(self, pacman):
+        if self.turn != ACTION_NONE and pacman.direction == ACTION_DIRECTIONS[self.turn]:
+            if self.requested is not None:
+                self.taken = self.requested
+                self.requested = None
+            if self.expires is not None:
+                self.turn = ACTION_NONE  # Done; held keys keep asking until released
+
+    def frame_presented(self, now):
+        # Seconds from the request to the first frame showing its turn, or None
+        if self.taken is None:
+            return None
+        latency, self.taken = now - self.taken, None
+        return latency
+
+    def clear(self):
+        self.turn = ACTION_NONE
+        self.expires = self.requested = self.taken = None
+
+
+class Game(Simulation):
+    # Window, keyboard and drawing on top of the Simulation rules
+    def __init__(self, seed=None, ghost_count=len(GHOST_COLORS), profiler=None, layout=None, game_time=GAME_TIME,
+                 ghost_mode=GHOST_MODE, record_path=None, telemetry=None):
+        init_display()
+        self.running = True
+        super().__init__(seed, ghost_count, layout, game_time, ghost_mode, profiler=profiler)
+        self.speed = 1.0  # Simulated seconds per real second
+        self.playback = None  # Iterator of recorded actions that replaces the keyboard
+        self.input_queue = InputQueue()
+        self.record_path = record_path  # Each game's replay is saved here when it ends
+        self.replays_saved = 0
+        self.start_recording()
+        self.telemetry = telemetry  # Optional telemetry.Telemetry, told about every state change
+        self.overlay = None  # Profiler overlay surface, refreshed every OVERLAY_REFRESH frames
+        self.overlay_font = pygame.font.Font(None, int(14 * SCALE_FACTOR)) if profiler else None
+        self.load_buttom_image()  # Load the 'buttom.png' image
+        # Actor positions before the latest step, x and y per actor, Pac-Man first
+        self.previous_positions = array('i', [0]) * (2 * (1 + len(self.ghosts)))
+        self.build_background()
+        if telemetry:
+            telemetry.event('session_start', platform=sys.platform, pygame=pygame.version.ver, fps=FPS,
+                            scale_factor=SCALE_FACTOR, ghosts=self.ghost_count, ghost_mode=self.ghost_mode)
+            telemetry.event('assets', load_ms={path: round(seconds * 1000, 2) for path, seconds in asset_load_times.items()})
+        self.start_tracking()
+
+    def load_buttom_image(self):
+        # Load and scale the buttom image
+        self.buttom_image = load_image(BUTTOM_IMAGE, BUTTOM_SIZE)
+        self.buttom_rect = self.buttom_image.get_rect(midbottom=(WIDTH // 2, HEIGHT))
+
+    def build_background(self):
+        # Static layer: maze plus the buttom image, restored under moving sprites
+        self.background = self.maze.render_background([(self.buttom_image, self.buttom_rect)])
+        self.dirty_rects = []  # Screen areas drawn over last frame
+        self.full_redraw = True
+        self.accumulator = 0.0  # Time not yet consumed by logic steps
+        self.remember_positions()
+
+    def remember_positions(self):
+        positions = self.previous_positions
+        positions[0], positions[1] = self.pacman.rect.topleft
+        for i, ghost in enumerate(self.ghosts, 1):
+            positions[2 * i], positions[2 * i + 1] = ghost.rect.topleft
+
+    def render_rect(self, index, rect, alpha):
+        # Where to draw an actor alpha of the way from its previous to its current position
+        x, y = self.previous_positions[2 * index], self.previous_positions[2 * index + 1]
+        if alpha is None or abs(rect.x - x) > TILE_SIZE or abs(rect.y - y) > TILE_SIZE:
+            return rect.copy()  # Respawns jump rather than slide
+        return pygame.Rect(x + round((rect.x - x) * alpha), y + round((rect.y - y) * alpha), rect.width, rect.height)
 
     def reset_game(self):
-        self.maze = Maze(self.load_maze())
-        self.pacman = PacMan((13 * TILE_SIZE, 23 * TILE_SIZE))
-        self.ghosts = self.create_ghosts()
-        self.state = 'playing'
-        self.start_time = None
-        self.time_left = GAME_TIME
-        self.load_buttom_image()
+        # Retry reuses the maze, actors, sprites and background surface; a fresh
+        # seed keeps the new game replayable on its own
+        self.reset(random.getrandbits(63))
+        self.build_background()
+        self.input_queue.clear()
+        self.start_recording()
+        self.start_tracking()
+
+    def start_tracking(self):
+        # What telemetry has already been told about the current game
+        self.reported_first_move = False
+        self.reported_lives = self.pacman.lives
+        self.reported_end = False
+        if self.telemetry:
+            self.telemetry.event('game_start', seed=self.seed)
+            self.telemetry.flush()
+
+    def track_gameplay(self):
+        # Once per frame, allocating only when something worth reporting happened
+        telemetry = self.telemetry
+        if not self.reported_first_move and self.start_tick is not None:
+            self.reported_first_move = True
+            telemetry.event('first_move', seconds=round(self.start_tick / FPS, 3))
+        if self.pacman.lives < self.reported_lives:
+            self.reported_lives = self.pacman.lives
+            telemetry.event('death', lives=self.pacman.lives, tick=self.tick, score=self.pacman.score)
+        if self.state != 'playing' and not self.reported_end:
+            self.reported_end = True
+            maze = self.maze
+            telemetry.event(
+                'game_end', result=self.state, score=self.pacman.score, ticks=self.tick,
+                time_used=self.game_time - self.time_left,
+                dots_eaten=len(maze.dot_tiles) - maze.dot_grid.count(1),
+                pellets_eaten=sum(1 for index in maze.pellet_tiles if not maze.pellet_grid[index]),
+            )
+            telemetry.flush()
+
+    def start_recording(self):
+        if self.record_path:
+            from replay import ReplayRecorder
+            self.recorder = ReplayRecorder(self)
+
+    def save_replay(self):
+        if self.recorder is None:
+            return
+        root, ext = os.path.splitext(self.record_path)
+        path = self.record_path if self.replays_saved == 0 else f"{root}-{self.replays_saved + 1}{ext}"
+        self.replays_saved += 1
+        try:
+            with open(path, 'wb') as f:
+                f.write(self.recorder.finish(self))
+        except OSError as error:
+            print(f"Could not save replay: {error}")
+        self.recorder = None
 
     # def run(self):
     #     while self.running:
@@ -408,75 +1155,109 @@ class Game:
     #     sys.exit()
 
     def handle_events(self):
-        keys = pygame.key.get_pressed()
-        if (keys[pygame.K_w] or keys[pygame.K_s] or keys[pygame.K_c]) and \
-           (keys[pygame.K_w] and keys[pygame.K_s] and keys[pygame.K_c]):
-            self.state = 'won'
-        for event in pygame.event.get():
+        queue = self.input_queue
+        queue.pump()
+        while not queue.events.empty():
+            now, event = queue.events.get_nowait()
+            if queue.handle(now, event):
+                continue
             if event.type == pygame.QUIT:
                 self.running = False
+            elif event.type == pygame.KEYDOWN and event.key in CHEAT_KEYS:
+                keys = pygame.key.get_pressed()
+                if all(keys[key] for key in CHEAT_KEYS):
+                    self.state = 'won'
             elif self.state == 'game_over' and event.type == pygame.MOUSEBUTTONDOWN:
                 if self.retry_button.collidepoint(event.pos):
                     self.reset_game()
             elif self.state == 'won' and event.type == pygame.MOUSEBUTTONDOWN:
                 if self.link_rect.collidepoint(event.pos):
+                    if self.telemetry:
+                        self.telemetry.event('careers_click', score=self.pacman.score)
+                        self.telemetry.flush()
                     import webbrowser
                     webbrowser.open("https://wsc-sports.com/careers/?coref=1.10.r7E_21D&t=1727432954943")
 
-    def update(self):
-        self.pacman.update(self.maze)
-        self.pacman.update_power_mode()
-        player_moved = self.pacman.has_moved
-
-        if player_moved and self.start_time is None:
-            self.start_time = pygame.time.get_ticks()
-
-        for ghost in self.ghosts:
-            ghost.update(self.maze, self.pacman.power_mode, player_moved)
-        self.check_collisions()
-        # Update timer
-        if self.start_time:
-            elapsed_time = (pygame.time.get_ticks() - self.start_time) / 1000
-            self.time_left = max(0, GAME_TIME - int(elapsed_time))
-            if self.time_left <= 0:
-                self.state = 'game_over'
+    def update(self, frame_time=STEP_TIME):
+        # Run as many fixed steps as the elapsed time covers; the remainder carries over
+        self.accumulator += min(frame_time, MAX_FRAME_TIME) * self.speed
+        now = time.perf_counter()
+        while self.accumulator >= STEP_TIME and self.state == 'playing':
+            self.remember_positions()
+            if self.playback is not None:
+                self.step(next(self.playback, ACTION_NONE))
+            else:
+                self.step(self.input_queue.next_action(now))
+                self.input_queue.after_step(self.pacman)
+            self.accumulator -= STEP_TIME
 
-    def draw(self):
-        # Fill the background with black
-        screen.fill(BLACK)
-        self.maze.draw(screen)
-        self.pacman.draw(screen)
-        for ghost in self.ghosts:
-            ghost.draw(screen)
-        self.draw_score()
-        self.draw_lives()
-        self.draw_timer()
-        # Draw the buttom image
-        screen.blit(self.buttom_image, self.buttom_rect)
+    def draw(self, alpha=None):
+        # Returns the screen areas that changed, for pygame.display.update. alpha is
+        # how far into the next step the frame is; None draws the current positions
+        previous_rects = self.dirty_rects
+        sprite_rects = [self.render_rect(0, self.pacman.rect, alpha)]
+        sprite_rects.extend(self.render_rect(i, ghost.rect, alpha) for i, ghost in enumerate(self.ghosts, 1))
+        ghost_rects_end = len(sprite_rects)
+        sprite_rects.extend(self.maze.erased_rects)
+        self.maze.erased_rects.clear()
+        profiler = self.profiler
+        if self.full_redraw:
+            screen.blit(self.background, (0, 0))
+        else:
+            # Restore the background where sprites were and are about to be drawn
+            for rect in previous_rects + sprite_rects:
+                screen.blit(self.background, rect, rect)
+        if profiler:
+            profiler.mark('maze')
+        self.pacman.draw(screen, sprite_rects[0])
+        for i in range(1, ghost_rects_end):
+            self.ghosts[i - 1].draw(screen, sprite_rects[i])
+        if profiler:
+            profiler.mark('sprites')
+        hud_rects = [self.draw_score(), self.draw_lives(), self.draw_timer()]
+        if profiler:
+            profiler.mark('hud')
+            hud_rects.append(self.draw_profile_overlay())
+            profiler.skip()  # The overlay is not part of the game's own frame cost
+        self.dirty_rects = sprite_rects + hud_rects
+        if self.full_redraw:
+            self.full_redraw = False
+            return [screen.get_rect()]
+        return previous_rects + self.dirty_rects
 
     def draw_score(self):
-        score_text = font.render(f"Score: {self.pacman.score}", True, WHITE)
-        screen.blit(score_text, (int(10 * SCALE_FACTOR), HEIGHT - FONT_SIZE - int(55 * SCALE_FACTOR)))
+        score_text = text_cache.render(f"Score: {self.pacman.score}", WHITE)
+        return screen.blit(score_text, (int(10 * SCALE_FACTOR), HEIGHT - FONT_SIZE - int(55 * SCALE_FACTOR)))
 
     def draw_lives(self):
-        lives_text = font.render(f"Lives: {self.pacman.lives}", True, WHITE)
-        screen.blit(lives_text, (WIDTH - int(100 * SCALE_FACTOR), HEIGHT - FONT_SIZE - int(55 * SCALE_FACTOR)))
+        lives_text = text_cache.render(f"Lives: {self.pacman.lives}", WHITE)
+        return screen.blit(lives_text, (WIDTH - int(100 * SCALE_FACTOR), HEIGHT - FONT_SIZE - int(55 * SCALE_FACTOR)))
 
     def draw_timer(self):
-        if self.start_time:
+        if self.start_tick is not None:
             minutes = self.time_left // 60
             seconds = self.time_left % 60
-            timer_text = font.render(f"Time: {minutes}:{seconds:02}", True, WHITE)
+            timer_text = text_cache.render(f"Time: {minutes}:{seconds:02}", WHITE)
         else:
-            minutes = GAME_TIME // 60
-            seconds = GAME_TIME % 60
-            timer_text = font.render(f"Time: {minutes}:{seconds:02}", True, WHITE)
-        screen.blit(timer_text, (WIDTH // 2 - timer_text.get_width() // 2, HEIGHT - FONT_SIZE - int(55 * SCALE_FACTOR)))
+            minutes = self.game_time // 60
+            seconds = self.game_time % 60
+            timer_text = text_cache.render(f"Time: {minutes}:{seconds:02}", WHITE)
+        return screen.blit(timer_text, (WIDTH // 2 - timer_text.get_width() // 2, HEIGHT - FONT_SIZE - int(55 * SCALE_FACTOR)))
+
+    def draw_profile_overlay(self):
+        if self.overlay is None or self.profiler.frames % OVERLAY_REFRESH == 0:
+            lines = [surface_counter.add(self.overlay_font.render(line, True, WHITE)) for line in self.profiler.overlay_lines()]
+            line_height = self.overlay_font.get_linesize()
+            self.overlay = surface_counter.add(pygame.Surface((max(line.get_width() for line in lines) + 8, line_height * len(lines) + 8), pygame.SRCALPHA))
+            self.overlay.fill((0, 0, 0, 180))
+            for i, line in enumerate(lines):
+                self.overlay.blit(line, (4, 4 + i * line_height))
+        return screen.blit(self.overlay, (0, 0))
 
     def show_game_over_screen(self):
         screen.fill(BLACK)
-        game_over_text = font.render("Game Over", True, WHITE)
-        retry_text = font.render("Retry", True, WHITE)
+        game_over_text = text_cache.render("Game Over", WHITE)
+        retry_text = text_cache.render("Retry", WHITE)
         screen.blit(game_over_text, (WIDTH // 2 - game_over_text.get_width() // 2, HEIGHT // 2 - int(50 * SCALE_FACTOR)))
         self.retry_button = retry_text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
         pygame.draw.rect(screen, GLOWING_YELLOW, self.retry_button.inflate(int(20 * SCALE_FACTOR), int(10 * SCALE_FACTOR)), border_radius=5)
@@ -484,27 +1265,68 @@ class Game:
 
     def show_win_screen(self):
         screen.fill(BLACK)
-        win_text = font.render("You Won!", True, WHITE)
-        message_text = font.render("WSC Sports is Hiring - Click Here", True, GLOWING_YELLOW)
+        win_text = text_cache.render("You Won!", WHITE)
+        message_text = text_cache.render("WSC Sports is Hiring - Click Here", GLOWING_YELLOW)
         screen.blit(win_text, (WIDTH // 2 - win_text.get_width() // 2, HEIGHT // 2 - int(50 * SCALE_FACTOR)))
         self.link_rect = message_text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
         screen.blit(message_text, self.link_rect)
 
     async def run(self):
+        # Logic advances in fixed STEP_TIME steps however fast frames are drawn;
+        # slow devices draw fewer frames, fast ones interpolate between steps
+        profiler = self.profiler
+        last_frame = time.perf_counter()
         while self.running:
+            if profiler:
+                profiler.begin_frame()
+            now = time.perf_counter()
+            frame_time, last_frame = now - last_frame, now
             self.handle_events()
+            if profiler:
+                profiler.mark('handle_events')
             if self.state == 'playing':
-                self.update()
-                self.draw()
-            elif self.state == 'game_over':
-                self.show_game_over_screen()
-            elif self.state == 'won':
-                self.show_win_screen()
-            pygame.display.flip()
+                self.update(frame_time)
+                rects = self.draw(self.accumulator / STEP_TIME)
+                # Only push the areas that changed since the last frame
+                pygame.display.update(rects)
+                latency = self.input_queue.frame_presented(time.perf_counter())
+                if profiler and latency is not None:
+                    profiler.record('input_latency', latency)
+                if profiler:
+                    profiler.mark('display')
+                    if self.state != 'playing':
+                        # Browsers never exit, so report at the end of every game too
+                        profiler.dump()
+            else:
+                self.save_replay()  # Once per game; a no-op when not recording
+                if self.state == 'game_over':
+                    self.show_game_over_screen()
+                elif self.state == 'won':
+                    self.show_win_screen()
+                pygame.display.flip()
+                # The end screens cover the maze, so repaint it all on retry
+                self.full_redraw = True
+                if profiler:
+                    profiler.mark('display')
+            if self.telemetry:
+                self.telemetry.frame(frame_time)
+                self.track_gameplay()
+            surface_counter.end_frame()
             await asyncio.sleep(0)  # Yield to the event loop
-            clock.tick(FPS)
+            if profiler:
+                profiler.mark('yield')
+            clock.tick(RENDER_FPS)
+            if profiler:
+                profiler.mark('clock_tick')
 
 
 if __name__ == "__main__":
-    game = Game()
+    record_path = os.environ.get("PACMAN_RECORD")
+    if "--record" in sys.argv[1:-1]:
+        record_path = sys.argv[sys.argv.index("--record") + 1]
+    ghost_count = int(os.environ.get("PACMAN_GHOSTS", len(GHOST_COLORS)))
+    if "--ghosts" in sys.argv[1:-1]:
+        ghost_count = int(sys.argv[sys.argv.index("--ghosts") + 1])
+    game = Game(ghost_count=ghost_count, profiler=start_profiler(1 / FPS) if profiling_requested(sys.argv) else None,
+                record_path=record_path, telemetry=start_telemetry(telemetry_sink_spec(sys.argv)))
     asyncio.run(game.run())
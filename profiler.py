@@ -0,0 +1,130 @@
+# Opt-in frame profiler: times each phase of the game loop into fixed-size ring
+# buffers and reports rolling p50/p95/p99 per phase.
+#
+# Enable with PACMAN_PROFILE=1 or `python main.py --profile`; the JSON summary is
+# written to PACMAN_PROFILE_OUT (default profile.json) when the game exits, and
+# printed to the console as well, which is where it shows up in the browser build.
+import atexit
+import json
+import os
+import time
+from array import array
+
+PROFILE_WINDOW = 600  # Frames kept per phase, 10 seconds at 60 FPS
+OVERLAY_REFRESH = 30  # Frames between overlay text updates
+
+
+class FrameProfiler:
+    def __init__(self, size=PROFILE_WINDOW, frame_budget=1 / 60, path="profile.json"):
+        self.size = size
+        self.path = path
+        self.frame_budget = frame_budget
+        self.samples = {}  # Phase name -> ring buffer of seconds
+        self.events = {}  # Name -> [ring buffer of seconds, count] for samples not tied to frames
+        self.index = 0  # Slot of the current frame in every ring buffer
+        self.frames = 0
+        self.stalls = 0  # Frames over budget
+        self.worst_frame = 0.0
+        self.frame_start = None
+        self.last_mark = None
+
+    def buffer(self, phase):
+        samples = self.samples.get(phase)
+        if samples is None:
+            samples = self.samples[phase] = array('d', [0.0]) * self.size
+        return samples
+
+    def begin_frame(self):
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            frame_time = now - self.frame_start
+            self.buffer('frame')[self.index] = frame_time
+            if frame_time > self.frame_budget * 1.5:
+                self.stalls += 1
+            self.worst_frame = max(self.worst_frame, frame_time)
+            self.frames += 1
+            self.index = self.frames % self.size
+            for samples in self.samples.values():
+                samples[self.index] = 0.0  # Phases skipped this frame count as zero
+        self.frame_start = self.last_mark = now
+
+    def mark(self, phase):
+        # Time since the previous mark (or frame start) is charged to phase. A frame
+        # that runs several fixed steps marks the same phase once per step, so the
+        # time adds up; begin_frame zeroes the slot
+        now = time.perf_counter()
+        samples = self.samples.get(phase)
+        if samples is None:
+            samples = self.buffer(phase)
+        samples[self.index] += now - self.last_mark
+        self.last_mark = now
+
+    def record(self, name, seconds):
+        # One sample of something measured per event rather than per frame, e.g. input latency
+        entry = self.events.get(name)
+        if entry is None:
+            entry = self.events[name] = [array('d', [0.0]) * self.size, 0]
+        entry[0][entry[1] % self.size] = seconds
+        entry[1] += 1
+
+    def skip(self):
+        # Restart the phase clock without charging the time to anything
+        self.last_mark = time.perf_counter()
+
+    def percentiles(self, phase):
+        return self.ring_percentiles(self.samples[phase], self.frames)
+
+    def event_percentiles(self, name):
+        samples, count = self.events[name]
+        return self.ring_percentiles(samples, count)
+
+    def ring_percentiles(self, samples, total):
+        count = min(total, self.size)
+        if count == 0:
+            return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+        if total >= self.size:
+            ordered = sorted(samples)
+        else:
+            ordered = sorted(samples[:count])
+        return {name: ordered[min(count - 1, int(round(q * (count - 1))))] * 1000
+                for name, q in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))}
+
+    def summary(self):
+        return {
+            'frames': self.frames,
+            'window': min(self.frames, self.size),
+            'stalls': self.stalls,
+            'worst_frame_ms': self.worst_frame * 1000,
+            'phases_ms': {phase: self.percentiles(phase) for phase in self.samples},
+            'events_ms': {name: dict(self.event_percentiles(name), count=self.events[name][1]) for name in self.events},
+        }
+
+    def dump(self, path=None):
+        text = json.dumps(self.summary(), indent=2)
+        print(text)
+        try:
+            with open(path or self.path, 'w') as f:
+                f.write(text)
+        except OSError:
+            pass  # Read-only file systems still get the console copy
+
+    def overlay_lines(self):
+        lines = [f"{'phase':<14}{'p50':>7}{'p95':>7}{'p99':>7}"]
+        for phase in self.samples:
+            stats = self.percentiles(phase)
+            lines.append(f"{phase:<14}{stats['p50']:>7.2f}{stats['p95']:>7.2f}{stats['p99']:>7.2f}")
+        for name in self.events:
+            stats = self.event_percentiles(name)
+            lines.append(f"{name:<14}{stats['p50']:>7.2f}{stats['p95']:>7.2f}{stats['p99']:>7.2f}")
+        lines.append(f"stalls {self.stalls}  worst {self.worst_frame * 1000:.1f} ms")
+        return lines
+
+
+def profiling_requested(argv):
+    return os.environ.get("PACMAN_PROFILE") == "1" or "--profile" in argv
+
+
+def start_profiler(frame_budget):
+    profiler = FrameProfiler(frame_budget=frame_budget, path=os.environ.get("PACMAN_PROFILE_OUT", "profile.json"))
+    atexit.register(profiler.dump)
+    return profiler
@@ -0,0 +1,209 @@
+# Compact binary replays: the seed and rule constants a game ran with, plus its
+# per-tick actions run-length encoded. The simulation is deterministic for a
+# seed, so re-running the actions headless reproduces the game exactly and a
+# claimed score can be checked without trusting the client that sent it.
+#
+# Usage: python main.py --record game.pmr          (or PACMAN_RECORD=game.pmr)
+#        python replay.py verify game.pmr [--maze levels/test.txt] [--ghosts 5 --game-time 90 --ghost-mode random]
+#        python replay.py play game.pmr --speed 4
+#
+# Layout: HEADER, RESULT as claimed by the recorder, then one varint per run of
+# identical actions holding (run length << 3) | action.
+#
+# Verification trusts nothing in the file: the rules it was played under must be
+# the ones the verifier expects, and the inputs may not run longer than a game can
+# last, so a crafted replay cannot buy an easier game or tie up the verifier.
+import argparse
+import asyncio
+import json
+import struct
+import sys
+import time
+
+import main
+from levels import as_level, load_level
+
+REPLAY_MAGIC = b'PMRP'
+REPLAY_VERSION = 1
+# magic, version, seed, FPS, game_time, POWER_PELLET_DURATION, SCALE_FACTOR, ghost count, ghost mode, layout CRC32
+HEADER = struct.Struct('<4sHQHIIdHBI')
+# ticks, score, lives, state
+RESULT = struct.Struct('<IiiB')
+GHOST_MODES = ('random', 'chase')
+STATES = ('playing', 'game_over', 'won')
+ACTION_BITS = 3
+MAX_VARINT_BYTES = 5  # Enough for runs of 2**32 ticks
+# Ticks a game may idle before Pac-Man first moves, when its clock starts
+MAX_IDLE_TICKS = 300 * main.FPS
+
+
+class ReplayError(ValueError):
+    pass
+
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, offset):
+    value = shift = 0
+    for _ in range(MAX_VARINT_BYTES):
+        if offset >= len(data):
+            raise ReplayError("Replay ends inside an input run")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+    raise ReplayError(f"Input run longer than {MAX_VARINT_BYTES} bytes at offset {offset}")
+
+
+class ReplayRecorder:
+    # Attached as Simulation.recorder; step() hands it every tick's action
+    def __init__(self, sim):
+        self.header = HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, sim.seed, main.FPS, sim.game_time,
+                                  main.POWER_PELLET_DURATION, main.SCALE_FACTOR, sim.ghost_count,
+                                  GHOST_MODES.index(sim.ghost_mode), sim.maze.level.crc)
+        self.runs = bytearray()
+        self.action = main.ACTION_NONE
+        self.count = 0
+
+    def record(self, action):
+        if action == self.action:
+            self.count += 1
+        else:
+            self.end_run()
+            self.action = action
+            self.count = 1
+
+    def end_run(self):
+        if self.count:
+            write_varint(self.runs, self.count << ACTION_BITS | self.action)
+        self.count = 0
+
+    def finish(self, sim):
+        # The whole replay as bytes, with sim's final state as the claimed result
+        self.end_run()
+        result = RESULT.pack(sim.tick, sim.pacman.score, sim.pacman.lives, STATES.index(sim.state))
+        return self.header + result + bytes(self.runs)
+
+
+class Replay:
+    def __init__(self, data):
+        if len(data) < HEADER.size + RESULT.size:
+            raise ReplayError("Replay is truncated")
+        (magic, version, self.seed, self.fps, self.game_time, self.power_duration, self.scale_factor,
+         self.ghost_count, ghost_mode, self.layout_crc) = HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC:
+            raise ReplayError("Not a replay file")
+        if version != REPLAY_VERSION:
+            raise ReplayError(f"Unsupported replay version {version}")
+        if ghost_mode >= len(GHOST_MODES):
+            raise ReplayError(f"Unknown ghost mode {ghost_mode}")
+        self.ghost_mode = GHOST_MODES[ghost_mode]
+        self.ticks, self.score, self.lives, state = RESULT.unpack_from(data, HEADER.size)
+        if state >= len(STATES):
+            raise ReplayError(f"Unknown game state {state}")
+        self.state = STATES[state]
+        self.runs = []  # (action, ticks) pairs
+        self.total_ticks = 0  # Sum of the run lengths, known before anything is simulated
+        offset = HEADER.size + RESULT.size
+        while offset < len(data):
+            value, offset = read_varint(data, offset)
+            self.runs.append((value & (1 << ACTION_BITS) - 1, value >> ACTION_BITS))
+            self.total_ticks += value >> ACTION_BITS
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    def actions(self):
+        for action, count in self.runs:
+            for _ in range(count):
+                yield action
+
+    def check_compatible(self, layout=None, game_time=main.GAME_TIME, ghost_count=len(main.GHOST_COLORS),
+                         ghost_mode=main.GHOST_MODE):
+        # The rules must be the ones expected here, not whatever the recorder wrote,
+        # or the re-simulation means nothing
+        if (self.fps, self.power_duration, self.scale_factor) != (main.FPS, main.POWER_PELLET_DURATION, main.SCALE_FACTOR):
+            raise ReplayError("Replay was recorded with different game constants")
+        for name, recorded, expected in (('game time', self.game_time, game_time),
+                                         ('ghost count', self.ghost_count, ghost_count),
+                                         ('ghost mode', self.ghost_mode, ghost_mode)):
+            if recorded != expected:
+                raise ReplayError(f"Replay was recorded with {name} {recorded}, expected {expected}")
+        if self.layout_crc != as_level(layout).crc:
+            raise ReplayError("Replay was recorded on a different maze")
+        # The clock runs out game_time seconds after the first move, so no honest game has more ticks than this
+        max_ticks = self.game_time * main.FPS + MAX_IDLE_TICKS
+        if self.total_ticks > max_ticks:
+            raise ReplayError(f"Replay has {self.total_ticks} ticks of input, more than the {max_ticks} a game can last")
+
+
+def simulate(replay, layout=None, **rules):
+    # Re-run the recorded game headless as fast as the CPU allows; rules are
+    # check_compatible's expected game_time, ghost_count and ghost_mode
+    replay.check_compatible(layout, **rules)
+    sim = main.Simulation(replay.seed, replay.ghost_count, layout, replay.game_time, replay.ghost_mode)
+    for action, count in replay.runs:
+        for _ in range(count):
+            if sim.state != 'playing':
+                raise ReplayError(f"Inputs continue after the game ended at tick {sim.tick}")
+            sim.step(action)
+    return sim
+
+
+def verify(replay, layout=None, **rules):
+    started = time.perf_counter()
+    try:
+        sim = simulate(replay, layout, **rules)
+    except ReplayError as error:
+        return {'valid': False, 'error': str(error)}
+    claimed = {'ticks': replay.ticks, 'score': replay.score, 'lives': replay.lives, 'state': replay.state}
+    actual = {'ticks': sim.tick, 'score': sim.pacman.score, 'lives': sim.pacman.lives, 'state': sim.state}
+    return {
+        'valid': claimed == actual,
+        'claimed': claimed,
+        'actual': actual,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def play(replay, layout=None, speed=1.0, **rules):
+    # Watch a replay in the window, speed times faster than real time
+    replay.check_compatible(layout, **rules)
+    game = main.Game(replay.seed, replay.ghost_count, layout=layout, game_time=replay.game_time, ghost_mode=replay.ghost_mode)
+    game.speed = speed
+    game.playback = replay.actions()
+    asyncio.run(game.run())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify or watch a recorded Pac-Man game")
+    parser.add_argument("command", choices=["verify", "play"])
+    parser.add_argument("replay")
+    parser.add_argument("--maze", help="level file the game was recorded on (default: levels/classic.txt)")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed multiplier")
+    parser.add_argument("--game-time", type=int, default=main.GAME_TIME, help="expected game length in seconds")
+    parser.add_argument("--ghosts", type=int, default=len(main.GHOST_COLORS), help="expected ghost count")
+    parser.add_argument("--ghost-mode", choices=GHOST_MODES, default=main.GHOST_MODE, help="expected ghost mode")
+    args = parser.parse_args()
+
+    layout = load_level(args.maze) if args.maze else None
+    rules = {'game_time': args.game_time, 'ghost_count': args.ghosts, 'ghost_mode': args.ghost_mode}
+    try:
+        replay = Replay.load(args.replay)
+    except ReplayError as error:
+        print(json.dumps({'valid': False, 'error': str(error)}, indent=2))
+        sys.exit(1)
+    if args.command == "verify":
+        report = verify(replay, layout, **rules)
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if report['valid'] else 1)
+    play(replay, layout, args.speed, **rules)
@@ -0,0 +1,103 @@
+# Stress mode: one generated maze, a growing number of ghosts, and the time of
+# every frame at each count, to find where the engine stops scaling linearly.
+# Headless by default; --draw renders each frame too, on a maze that fits the window.
+# --compare times every count with both ghost-player broad phases, the ordered
+# linear scan and the GhostGrid, to place main.GHOST_GRID_MIN_GHOSTS.
+#
+# Usage: python stress.py --ghosts 5 50 100 200 500 --size 201 --frames 600
+#        python stress.py --ghosts 50 200 500 --draw --out stress.json
+#        python stress.py --ghosts 50 500 2000 --compare
+import argparse
+import json
+import statistics
+import time
+
+import main
+from levels import compile_layout, generate_layout
+from tournament import RandomAgent
+
+DEFAULT_GHOSTS = [5, 25, 50, 100, 200, 500]
+
+
+def run_stress(ghost_count, level, frames, seed=0, ghost_mode=main.GHOST_MODE, draw=False, ghost_grid=None):
+    # Seconds per frame for frames frames; finished games restart outside the timings.
+    # ghost_grid forces the broad phase on or off; None leaves the engine's choice
+    if draw:
+        game = main.Game(seed, ghost_count, layout=level, ghost_mode=ghost_mode)
+    else:
+        game = main.Simulation(seed, ghost_count, level, ghost_mode=ghost_mode)
+    if ghost_grid is not None:
+        game.use_ghost_grid(ghost_grid)
+    agent = RandomAgent(seed)
+    timings = []
+    for frame in range(frames):
+        if game.state != 'playing':
+            game.reset(seed + frame)
+            if draw:
+                game.build_background()
+        started = time.perf_counter()
+        game.step(agent(game))
+        if draw:
+            main.pygame.display.update(game.draw())
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def summarize(ghost_count, timings):
+    ordered = sorted(timings)
+    mean = statistics.fmean(timings)
+    return {
+        'ghosts': ghost_count,
+        'mean_ms': mean * 1000,
+        'p50_ms': ordered[len(ordered) // 2] * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        'us_per_ghost': mean / ghost_count * 1e6,
+        'fps_ceiling': 1 / mean,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time frames on a generated maze as the ghost count grows")
+    parser.add_argument("--ghosts", type=int, nargs="+", default=DEFAULT_GHOSTS)
+    parser.add_argument("--size", type=int, default=201, help="maze width and height in tiles")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ghost-mode", choices=["random", "chase"], default=main.GHOST_MODE)
+    parser.add_argument("--draw", action="store_true", help="render too; the maze shrinks to fit the window")
+    parser.add_argument("--compare", action="store_true", help="time the linear scan and the grid broad phase")
+    parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args()
+
+    if args.draw:
+        width = min(args.size, main.WIDTH // main.TILE_SIZE)
+        height = min(args.size, (main.HEIGHT - main.BUTTOM_SIZE[1]) // main.TILE_SIZE)
+    else:
+        width = height = args.size
+    metadata, rows = generate_layout(width, height, args.seed)
+    level = compile_layout(rows, metadata)
+    print(f"Maze {level.width}x{level.height}, {len(level.dot_tiles)} dots, {args.frames} frames per count")
+    phases = {'linear': False, 'grid': True} if args.compare else {'auto': None}
+    print(f"{'ghosts':>7}{'phase':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'us/ghost':>10}{'fps':>9}")
+    results = []
+    comparison = []
+    for ghost_count in args.ghosts:
+        by_phase = {}
+        for phase, ghost_grid in phases.items():
+            timings = run_stress(ghost_count, level, args.frames, args.seed, args.ghost_mode, args.draw, ghost_grid)
+            result = by_phase[phase] = dict(summarize(ghost_count, timings), broad_phase=phase)
+            print(f"{ghost_count:>7}{phase:>8}{result['mean_ms']:>10.3f}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}"
+                  f"{result['us_per_ghost']:>10.2f}{result['fps_ceiling']:>9.0f}")
+        results.append(by_phase.get('auto') or min(by_phase.values(), key=lambda result: result['p50_ms']))
+        if args.compare:
+            comparison.append((ghost_count, by_phase['grid']['p50_ms'] / by_phase['linear']['p50_ms']))
+    for ghost_count, ratio in comparison:
+        print(f"{ghost_count:>7} ghosts: grid p50 is {ratio:.2f}x the linear scan's")
+    # Near-linear scaling keeps the cost per ghost flat as the count grows
+    first, last = results[0], results[-1]
+    print(f"Cost per ghost changed {last['us_per_ghost'] / first['us_per_ghost'] - 1:+.0%} "
+          f"from {first['ghosts']} to {last['ghosts']} ghosts")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'maze': [level.width, level.height], 'frames': args.frames, 'draw': args.draw,
+                       'ghost_mode': args.ghost_mode, 'results': results,
+                       'grid_vs_linear_p50': {str(count): ratio for count, ratio in comparison}}, f, indent=2)
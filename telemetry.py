@@ -0,0 +1,175 @@
+# Session telemetry: gameplay events and a frame-time histogram buffered in
+# memory, and handed to a sink in one batch at each state transition (game over,
+# win, retry, quit). Frames only bump a histogram counter, so the loop never
+# allocates or waits for it; file writes and HTTP sends happen off the frame loop.
+#
+# Enable with PACMAN_TELEMETRY or `python main.py --telemetry SINK`, where SINK is
+# a file path (JSON lines), an http(s):// URL (POSTed JSON), or 'stub' to keep
+# batches in memory and print them, e.g. for testing against no server at all.
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from array import array
+from bisect import bisect_left
+
+# Upper bounds of the frame-time histogram buckets, in milliseconds; the last bucket is open-ended
+FRAME_BUCKETS_MS = (4, 8, 12, 16.7, 20, 25, 33.3, 50, 100, 250)
+FRAME_BUCKETS = tuple(bound / 1000 for bound in FRAME_BUCKETS_MS)
+HTTP_TIMEOUT = 5  # Seconds per POST, on the sender thread
+
+
+class QueuedSink:
+    # Base for sinks whose delivery can block: send() queues the batch as JSON and
+    # a background thread delivers it. The browser build has no threads, so there
+    # deliver() runs inline
+    def __init__(self):
+        self.pending = queue.SimpleQueue()
+        self.thread = None
+        self.failures = 0
+
+    def send(self, batch):
+        body = json.dumps(batch)
+        if sys.platform == "emscripten":
+            self.deliver_or_count(body)
+            return
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True)
+            self.thread.start()
+        self.pending.put(body)
+
+    def run(self):
+        while True:
+            body = self.pending.get()
+            if body is None:
+                return
+            self.deliver_or_count(body)
+
+    def deliver_or_count(self, body):
+        try:
+            self.deliver(body)
+        except OSError:
+            self.failures += 1  # Telemetry never takes the game down
+
+    def deliver(self, body):
+        raise NotImplementedError
+
+    def close(self, timeout=2.0):
+        # Give queued batches a moment to go out at exit
+        if self.thread is not None:
+            self.pending.put(None)
+            self.thread.join(timeout)
+
+
+class FileSink(QueuedSink):
+    # Appends each batch as one JSON line
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def deliver(self, body):
+        with open(self.path, 'a') as f:
+            f.write(body + '\n')
+
+
+class HttpSink(QueuedSink):
+    # POSTs each batch as JSON; in the browser build the page's sendBeacon
+    # queues it instead
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+
+    def send(self, batch):
+        if sys.platform == "emscripten":
+            import platform
+            platform.window.navigator.sendBeacon(self.url, json.dumps(batch))
+            return
+        super().send(batch)
+
+    def deliver(self, body):
+        request = urllib.request.Request(self.url, body.encode(), {'Content-Type': 'application/json'})
+        urllib.request.urlopen(request, timeout=HTTP_TIMEOUT).close()
+
+
+class StubSink:
+    # Stands in for the HTTP endpoint: keeps every batch and echoes it to the console
+    def __init__(self, echo=True):
+        self.batches = []
+        self.echo = echo
+
+    def send(self, batch):
+        self.batches.append(batch)
+        if self.echo:
+            print(json.dumps(batch))
+
+    def close(self):
+        pass
+
+
+def make_sink(spec):
+    if spec == 'stub':
+        return StubSink()
+    if spec.startswith(('http://', 'https://')):
+        return HttpSink(spec)
+    return FileSink(spec)
+
+
+class Telemetry:
+    def __init__(self, sink):
+        self.sink = sink
+        self.session = uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.events = []  # Buffered since the last flush
+        self.frame_histogram = array('I', [0]) * (len(FRAME_BUCKETS) + 1)
+        self.frames = 0
+
+    def event(self, name, **fields):
+        # For state changes only; frames go through frame()
+        fields['event'] = name
+        fields['t'] = round(time.perf_counter() - self.started, 3)
+        self.events.append(fields)
+
+    def frame(self, seconds):
+        self.frame_histogram[bisect_left(FRAME_BUCKETS, seconds)] += 1
+        self.frames += 1
+
+    def flush(self):
+        if not self.events and not self.frames:
+            return
+        buckets = [f"<={bound}" for bound in FRAME_BUCKETS_MS] + [f">{FRAME_BUCKETS_MS[-1]}"]
+        batch = {
+            'session': self.session,
+            'sent_at': time.time(),
+            'events': self.events,
+            'frame_ms_histogram': dict(zip(buckets, self.frame_histogram)),
+        }
+        self.events = []
+        for i in range(len(self.frame_histogram)):
+            self.frame_histogram[i] = 0
+        self.frames = 0
+        self.sink.send(batch)
+
+    def close(self):
+        self.event('session_end')
+        self.flush()
+        self.sink.close()
+
+
+def telemetry_sink_spec(argv):
+    if "--telemetry" in argv[1:-1]:
+        return argv[argv.index("--telemetry") + 1]
+    return os.environ.get("PACMAN_TELEMETRY", "")
+
+
+def start_telemetry(spec):
+    # None when telemetry is off
+    if not spec:
+        return None
+    telemetry = Telemetry(make_sink(spec))
+    atexit.register(telemetry.close)
+    return telemetry
@@ -0,0 +1,187 @@
+# Runs many headless games across all CPU cores with a scripted agent in place
+# of the keyboard, and streams one result per game to a JSONL or CSV file.
+#
+# Usage: python tournament.py --games 1000 --agent random --ghosts 5 --out results.jsonl
+#        python tournament.py --agent my_bots:ChaseAgent --maze levels/test.txt --out results.csv
+#
+# An agent is a class built as Agent(seed) and called as agent(simulation) once per
+# tick; it returns one of the main.ACTION_* codes.
+import argparse
+import csv
+import importlib
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import main
+from levels import load_level
+
+RESULT_FIELDS = ['game', 'seed', 'score', 'lives_lost', 'ticks', 'time_used', 'won', 'state']
+DIRECTION_ACTIONS = {(-1, 0): main.ACTION_LEFT, (1, 0): main.ACTION_RIGHT, (0, -1): main.ACTION_UP, (0, 1): main.ACTION_DOWN}
+
+
+class RandomAgent:
+    # Holds an arrow key and switches to a random one now and then
+    def __init__(self, seed, switch_chance=0.05):
+        self.rng = random.Random(seed)
+        self.switch_chance = switch_chance
+        self.action = self.rng.choice(list(main.ACTION_DIRECTIONS))
+
+    def __call__(self, sim):
+        if self.rng.random() < self.switch_chance:
+            self.action = self.rng.choice(list(main.ACTION_DIRECTIONS))
+        return self.action
+
+
+class DotSeekerAgent:
+    # Heads for the nearest remaining dot or pellet, re-planning on every tile
+    def __init__(self, seed):
+        self.action = main.ACTION_LEFT
+
+    def __call__(self, sim):
+        rect = sim.pacman.rect
+        if rect.x % main.TILE_SIZE == 0 and rect.y % main.TILE_SIZE == 0:
+            self.action = self.plan(sim.maze, (rect.x // main.TILE_SIZE, rect.y // main.TILE_SIZE))
+        return self.action
+
+    def plan(self, maze, start):
+        # Breadth-first search over open tiles; returns the first move towards the closest target
+        first_moves = {start: None}
+        queue = deque([start])
+        while queue:
+            tile = queue.popleft()
+            if tile != start and (maze.has_dot(*tile) or maze.has_pellet(*tile)):
+                return DIRECTION_ACTIONS[first_moves[tile]]
+            for dx, dy in DIRECTION_ACTIONS:
+                neighbour = (tile[0] + dx, tile[1] + dy)
+                if neighbour in first_moves or not (0 <= neighbour[0] < maze.width and 0 <= neighbour[1] < maze.height):
+                    continue
+                if maze.is_wall(*neighbour):
+                    continue
+                first_moves[neighbour] = first_moves[tile] or (dx, dy)
+                queue.append(neighbour)
+        return self.action
+
+
+AGENTS = {
+    'random': RandomAgent,
+    'dots': DotSeekerAgent,
+}
+
+
+def load_agent(spec):
+    # A built-in name, or 'module:Class' for an agent defined elsewhere
+    if spec in AGENTS:
+        return AGENTS[spec]
+    module_name, _, attribute = spec.partition(':')
+    if not attribute:
+        raise ValueError(f"Unknown agent {spec!r}; use one of {sorted(AGENTS)} or 'module:Class'")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+# Per-process state, built once by init_worker and reused for every game
+worker = {}
+
+
+def init_worker(agent_spec, ghost_count, layout, game_time, max_ticks, ghost_mode):
+    worker['agent'] = load_agent(agent_spec)
+    worker['sim'] = main.Simulation(ghost_count=ghost_count, layout=layout, game_time=game_time, ghost_mode=ghost_mode)
+    worker['max_ticks'] = max_ticks
+
+
+def play_game(game, seed):
+    sim = worker['sim']
+    sim.reset(seed)
+    agent = worker['agent'](seed)
+    max_ticks = worker['max_ticks']
+    while sim.state == 'playing' and sim.tick < max_ticks:
+        sim.step(agent(sim))
+    return {
+        'game': game,
+        'seed': seed,
+        'score': sim.pacman.score,
+        'lives_lost': 3 - max(sim.pacman.lives, 0),
+        'ticks': sim.tick,
+        'time_used': sim.game_time - sim.time_left,
+        'won': sim.state == 'won',
+        'state': sim.state,
+    }
+
+
+class ResultWriter:
+    # Streams results as JSON lines, or CSV when the file name ends in .csv
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='') if path != '-' else sys.stdout
+        self.csv = csv.DictWriter(self.file, RESULT_FIELDS) if path.endswith('.csv') else None
+        if self.csv:
+            self.csv.writeheader()
+
+    def write(self, result):
+        if self.csv:
+            self.csv.writerow(result)
+        else:
+            self.file.write(json.dumps(result) + '\n')
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def run_tournament(games, agent_spec='random', ghost_count=len(main.GHOST_COLORS), layout=None, game_time=main.GAME_TIME,
+                   seed=0, out='-', workers=None, max_ticks=None, ghost_mode=main.GHOST_MODE):
+    if max_ticks is None:
+        # Idle agents never start the clock, so stop them eventually
+        max_ticks = game_time * main.FPS * 4
+    load_agent(agent_spec)  # Fail early on a bad spec
+    seeds = [seed + game for game in range(games)]
+    writer = ResultWriter(out)
+    totals = {'games': 0, 'won': 0, 'score': 0, 'lives_lost': 0, 'ticks': 0}
+    started = time.perf_counter()
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(workers, initializer=init_worker,
+                             initargs=(agent_spec, ghost_count, layout, game_time, max_ticks, ghost_mode)) as executor:
+        chunksize = max(1, games // (workers * 8))
+        for result in executor.map(play_game, range(games), seeds, chunksize=chunksize):
+            writer.write(result)
+            totals['games'] += 1
+            totals['won'] += result['won']
+            totals['score'] += result['score']
+            totals['lives_lost'] += result['lives_lost']
+            totals['ticks'] += result['ticks']
+    writer.close()
+    elapsed = time.perf_counter() - started
+    count = max(totals['games'], 1)
+    return {
+        'games': totals['games'],
+        'workers': workers,
+        'seconds': elapsed,
+        'games_per_second': totals['games'] / elapsed,
+        'ticks_per_second': totals['ticks'] / elapsed,
+        'win_rate': totals['won'] / count,
+        'mean_score': totals['score'] / count,
+        'mean_lives_lost': totals['lives_lost'] / count,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run headless Pac-Man games with a scripted agent on every core")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--agent", default="random", help=f"one of {sorted(AGENTS)} or module:Class")
+    parser.add_argument("--ghosts", type=int, default=len(main.GHOST_COLORS))
+    parser.add_argument("--ghost-mode", choices=["random", "chase"], default=main.GHOST_MODE)
+    parser.add_argument("--maze", help="level file, see levels.py (default: levels/classic.txt)")
+    parser.add_argument("--game-time", type=int, default=main.GAME_TIME)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game; game i uses seed + i")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-ticks", type=int, default=None)
+    parser.add_argument("--out", default="tournament.jsonl", help="results file (.jsonl or .csv, '-' for stdout)")
+    args = parser.parse_args()
+
+    layout = load_level(args.maze) if args.maze else None
+    summary = run_tournament(args.games, args.agent, args.ghosts, layout, args.game_time, args.seed, args.out,
+                             args.workers, args.max_ticks, args.ghost_mode)
+    print(json.dumps(summary, indent=2), file=sys.stderr)